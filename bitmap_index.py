@@ -0,0 +1,163 @@
+from typing import Dict, List, Tuple, Iterable, Optional
+
+
+# ---------------------------------------------------------------
+# DICTIONARY-ENCODED BITMAP INDEXES
+#
+# Each attribute domain (A1..A6) is encoded into dense codes 0..n-1,
+# assigned in value order. Every set of values of that attribute (a
+# projection, or an adjacency list pointing into it) is stored as a
+# Python int used as an n-bit bitmap over those codes, so the WCOJ
+# candidate intersections are a single big-int AND: a word-level loop
+# in C, with no hashing.
+#
+# Iterating a bitmap scans its bytes (int.to_bytes) through a 256-entry
+# table of bit positions and decodes the codes back to values, already
+# in sorted order. The resulting tuple is memoized per bitmap value in
+# the attribute's Dictionary: the same intersections come up again and
+# again across branches of the join, and a dict lookup of a small int is
+# much cheaper than sorting a set.
+#
+# Adjacency maps stay keyed by the *value* of the bound attribute, so
+# the engines loop over plain values and never decode output rows.
+# Attributes whose domain is too large or too sparse for bitmaps to pay
+# off keep plain sets of values (Dictionary.dense is False).
+# ---------------------------------------------------------------
+DENSE_MAX = 1 << 16     # largest domain stored as bitmaps (8 KB per bitmap)
+BITS_PER_MEMBER = 512   # bitmap bits allowed per set member (~ a set slot + int)
+MEMO_MAX = 1 << 20      # bitmaps whose members are remembered, per attribute
+
+# bit positions set in each byte value
+_BYTE_BITS = tuple(
+    tuple(i for i in range(8) if (b >> i) & 1) for b in range(256)
+)
+
+
+class Dictionary:
+    """
+    Order-preserving dictionary encoding of one attribute domain, and
+    the operations the engines need on its sets (bitmaps if dense,
+    sets of values otherwise).
+    """
+
+    def __init__(self, values: Iterable[int], dense: bool = True):
+        self.decode: List[int] = sorted(set(values))
+        self.encode: Dict[int, int] = {v: i for i, v in enumerate(self.decode)}
+        self.dense = dense
+        self.empty = 0 if dense else frozenset()
+        # bitmap -> tuple of member values (sorted)
+        self.memo: Dict[int, Tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.decode)
+
+    def make_set(self, values: Iterable[int]):
+        if not self.dense:
+            return set(values)
+        encode = self.encode
+        buf = bytearray((len(self.decode) + 7) // 8)
+        for v in values:
+            code = encode[v]
+            buf[code >> 3] |= 1 << (code & 7)
+        return int.from_bytes(buf, "little")
+
+    def members(self, s) -> Tuple[int, ...]:
+        """Sorted member values of a set of this attribute."""
+        if not self.dense:
+            return tuple(sorted(s))
+        out = self.memo.get(s)
+        if out is not None:
+            return out
+        decode = self.decode
+        vals = []
+        for pos, byte in enumerate(s.to_bytes((s.bit_length() + 7) // 8, "little")):
+            if byte:
+                base = pos << 3
+                vals.extend(decode[base + i] for i in _BYTE_BITS[byte])
+        out = tuple(vals)
+        if len(self.memo) < MEMO_MAX:
+            self.memo[s] = out
+        return out
+
+    def contains(self, s, value: int) -> bool:
+        if not self.dense:
+            return value in s
+        code = self.encode.get(value)
+        return code is not None and bool((s >> code) & 1)
+
+    def size(self, s) -> int:
+        return s.bit_count() if self.dense else len(s)
+
+
+def build_dictionaries(relations, schemas: Dict[str, List[str]]) -> Dict[str, Dictionary]:
+    """
+    One dictionary per attribute, over the union of all its columns.
+    An attribute is dense (bitmap-encoded) if its domain is at most
+    DENSE_MAX values and its adjacency lists have on average at least
+    one member per BITS_PER_MEMBER bits of domain.
+    """
+    domains: Dict[str, set] = {}
+    list_counts: Dict[str, int] = {}   # number of adjacency lists pointing into attr
+    for rname, schema in schemas.items():
+        rows = relations[rname]
+        for i, attr in enumerate(schema):
+            domains.setdefault(attr, set()).update(tup[i] for tup in rows)
+        if len(schema) == 2:
+            a, b = schema
+            # lists into b are keyed by a-values and vice versa
+            list_counts[b] = list_counts.get(b, 0) + len({tup[0] for tup in rows})
+            list_counts[a] = list_counts.get(a, 0) + len({tup[1] for tup in rows})
+
+    members: Dict[str, int] = {}
+    for rname, schema in schemas.items():
+        if len(schema) == 2:
+            n = len(set(relations[rname]))
+            for attr in schema:
+                members[attr] = members.get(attr, 0) + n
+
+    dictionaries = {}
+    for attr, vals in domains.items():
+        lists = list_counts.get(attr, 0)
+        avg = members.get(attr, 0) / lists if lists else 0.0
+        dense = len(vals) <= DENSE_MAX and (not lists or len(vals) <= BITS_PER_MEMBER * avg)
+        dictionaries[attr] = Dictionary(vals, dense)
+    return dictionaries
+
+
+def build_bitmap_indexes(relations, schemas: Dict[str, List[str]],
+                         dictionaries: Optional[Dict[str, Dictionary]] = None):
+    """
+    Encoded counterpart of generic_join.build_indexes. dictionaries may
+    be passed in if build_dictionaries was already run on relations.
+
+    :return: (dictionaries, proj_all, index) where proj_all[(rel, attr)]
+             is the set of values of attr (a bitmap if attr is dense) and
+             index[(rel, attr)] maps a value of attr to the set of values
+             of the other attribute, in that attribute's representation.
+    """
+    if dictionaries is None:
+        dictionaries = build_dictionaries(relations, schemas)
+    proj_all: Dict[Tuple[str, str], object] = {}
+    index: Dict[Tuple[str, str], Dict[int, object]] = {}
+
+    for rname, schema in schemas.items():
+        rows = relations[rname]
+        if len(schema) == 1:
+            a = schema[0]
+            proj_all[(rname, a)] = dictionaries[a].make_set(tup[0] for tup in rows)
+            continue
+
+        a, b = schema
+        a_lists: Dict[int, List[int]] = {}
+        b_lists: Dict[int, List[int]] = {}
+        for av, bv in rows:
+            a_lists.setdefault(av, []).append(bv)
+            b_lists.setdefault(bv, []).append(av)
+
+        dict_a, dict_b = dictionaries[a], dictionaries[b]
+        proj_all[(rname, a)] = dict_a.make_set(a_lists)
+        proj_all[(rname, b)] = dict_b.make_set(b_lists)
+        index[(rname, a)] = {k: dict_b.make_set(v) for k, v in a_lists.items()}
+        index[(rname, b)] = {k: dict_a.make_set(v) for k, v in b_lists.items()}
+
+    return dictionaries, proj_all, index
@@ -0,0 +1,168 @@
+import math
+from typing import Dict, List, Tuple, Optional, Iterable, Hashable, Union
+
+
+# ---------------------------------------------------------------
+# BLOOM FILTERS FOR SIDEWAYS INFORMATION PASSING
+#
+# Exact semijoins (ghw_join.semijoin_fast, fhw_join.semijoin) build a
+# Python set of key tuples from the whole inner table. A Bloom filter
+# answers the same "could this key join?" question in a few bits per key
+# with a small false-positive rate and no false negatives, so it can be
+# used to drop non-joining tuples from the *relations* before bag tables
+# are materialized. The exact semijoins still run afterwards, so false
+# positives only cost a little extra work, never wrong answers.
+#
+# The prefilter has to be cheaper than the semijoins it saves, so:
+#   - one filter per (relation, attribute), reused by every edge and
+#     both passes (rebuilt only once its relation has shrunk);
+#   - a key set of up to EXACT_MAX_KEYS values is used as is (an exact
+#     filter, probed in C); larger ones become a single-hash bit array;
+#   - a filter is only applied when the source has far fewer distinct
+#     keys than the target has rows (MIN_ROWS_PER_KEY), otherwise it
+#     can hardly eliminate anything.
+# ---------------------------------------------------------------
+DEFAULT_FP_RATE = 0.05
+EXACT_MAX_KEYS = 1 << 16
+MIN_ROWS_PER_KEY = 4
+REBUILD_SHRINK = 0.9  # rebuild a relation's filter below this fraction of its rows
+
+
+class BloomFilter:
+    """Single-hash Bloom filter (a bit array) over hashable keys."""
+
+    def __init__(self, capacity: int, fp_rate: float = DEFAULT_FP_RATE):
+        capacity = max(1, capacity)
+        # one hash: fp = 1 - exp(-n/m)
+        self.num_bits = max(8, int(math.ceil(capacity / -math.log1p(-fp_rate))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, key: Hashable):
+        pos = hash(key) % self.num_bits
+        self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: Hashable) -> bool:
+        pos = hash(key) % self.num_bits
+        return bool(self.bits[pos >> 3] >> (pos & 7) & 1)
+
+    def select(self, rows, attr: str) -> list:
+        """Rows whose attr value may be in the filter."""
+        bits, m = self.bits, self.num_bits
+        out = []
+        for row in rows:
+            pos = hash(row[attr]) % m
+            if bits[pos >> 3] >> (pos & 7) & 1:
+                out.append(row)
+        return out
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[Hashable], capacity: int,
+                  fp_rate: float = DEFAULT_FP_RATE) -> "BloomFilter":
+        bf = cls(capacity, fp_rate)
+        for key in keys:
+            bf.add(key)
+        return bf
+
+
+KeyFilter = Union[BloomFilter, set]
+
+
+def key_filter(keys: set, fp_rate: float = DEFAULT_FP_RATE) -> KeyFilter:
+    """The distinct keys themselves if few enough, else a Bloom filter."""
+    if len(keys) <= EXACT_MAX_KEYS:
+        return keys
+    return BloomFilter.from_keys(keys, len(keys), fp_rate)
+
+
+def _select(kf: KeyFilter, rows, attr: str) -> list:
+    if isinstance(kf, BloomFilter):
+        return kf.select(rows, attr)
+    return [row for row in rows if row[attr] in kf]
+
+
+def _tree_edges(bags, root: str) -> List[Tuple[str, str]]:
+    """
+    (parent, child) edges, bottom-up first and then top-down; the edge
+    at the turnaround is only visited once.
+    """
+    post: List[Tuple[str, str]] = []
+
+    def dfs(b):
+        for c in bags[b].children:
+            dfs(c)
+            post.append((b, c))
+
+    dfs(root)
+    return post + list(reversed(post))[1:]
+
+
+def sideways_prefilter(bags, relations: Dict[str, List[Dict[str, int]]],
+                       schemas: Dict[str, List[str]], root: str = "B1",
+                       fp_rate: float = DEFAULT_FP_RATE,
+                       stats: Optional[List[Dict]] = None) -> Dict[str, List[Dict[str, int]]]:
+    """
+    Push key filters on the join attributes along the decomposition.
+
+    For every tree edge (parent, child) and every attribute a the two
+    bags share, each relation of either bag that contains a is filtered
+    by the key filter of every other such relation, if that one has
+    sufficiently few distinct a-values. Edges are visited bottom-up and
+    then top-down, so a reduction near the leaves reaches the root and
+    back down again.
+
+    :param relations: rel_name -> list of dict rows (ghw_join format)
+    :param stats: if given, one entry per applied filter with the edge,
+                  attribute, source/target relations and rows eliminated
+    :return: a new relation dict (input lists are not modified)
+    """
+    rels = dict(relations)
+    # (rel, attr) -> (row count when built, distinct keys, filter)
+    filters: Dict[Tuple[str, str], Tuple[int, int, KeyFilter]] = {}
+
+    def filter_of(rel: str, a: str):
+        entry = filters.get((rel, a))
+        if entry is None or len(rels[rel]) < entry[0] * REBUILD_SHRINK:
+            keys = {row[a] for row in rels[rel]}
+            entry = (len(rels[rel]), len(keys), key_filter(keys, fp_rate))
+            filters[(rel, a)] = entry
+        return entry[1], entry[2]
+
+    for parent, child in _tree_edges(bags, root):
+        shared = [a for a in bags[parent].vars if a in bags[child].vars]
+        involved = list(dict.fromkeys(bags[parent].lambdas + bags[child].lambdas))
+        for a in shared:
+            holders = [r for r in involved if a in schemas[r]]
+            for src in holders:
+                for dst in holders:
+                    if dst == src:
+                        continue
+                    n_keys, kf = filter_of(src, a)
+                    before = len(rels[dst])
+                    if n_keys * MIN_ROWS_PER_KEY > before:
+                        continue
+                    rels[dst] = _select(kf, rels[dst], a)
+                    if stats is not None:
+                        stats.append({
+                            "edge": (parent, child),
+                            "attr": a,
+                            "source": src,
+                            "target": dst,
+                            "before": before,
+                            "eliminated": before - len(rels[dst]),
+                        })
+
+    return rels
+
+
+def summarize(stats: List[Dict]) -> str:
+    """One line per filter that eliminated anything."""
+    lines = []
+    for s in stats:
+        if s["eliminated"]:
+            lines.append(
+                f"{s['edge'][0]}-{s['edge'][1]} on {s['attr']}: "
+                f"{s['source']} -> {s['target']} eliminated {s['eliminated']}/{s['before']}"
+            )
+    total = sum(s["eliminated"] for s in stats)
+    lines.append(f"Total tuples eliminated by Bloom filters: {total}")
+    return "\n".join(lines)
@@ -0,0 +1,229 @@
+import math
+import random
+import time
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, List, Tuple, Optional, Callable
+
+
+# ---------------------------------------------------------------
+# SAMPLING-BASED OUTPUT CARDINALITY ESTIMATION (WANDER JOIN)
+#
+# A random walk picks a uniform distinct tuple of the first relation
+# (the indexes are sets, so duplicate rows would over-weight their
+# values) and then, for every further variable, a uniform neighbour
+# through an adjacency index. Relations that close a cycle (R3, R7) are
+# only checked. If the walk completes, it has found one output tuple
+# with probability
+#   p = 1/|distinct R_start| * prod(1/deg_i)
+# so 1/p (and 0 for a failed walk) is an unbiased estimate of the output
+# size (Horvitz-Thompson). Averaging walks until the time budget runs
+# out gives the estimate, and the CLT gives a confidence interval.
+# ---------------------------------------------------------------
+DEFAULT_TIME_BUDGET = 0.5
+DEFAULT_CONFIDENCE = 0.95
+
+
+class OutputTooLargeError(RuntimeError):
+    pass
+
+
+@dataclass
+class CardinalityEstimate:
+    estimate: float
+    low: float
+    high: float
+    walks: int
+    successes: int
+    elapsed: float
+    confidence: float = DEFAULT_CONFIDENCE
+
+    def __str__(self):
+        return (f"~{self.estimate:,.0f} rows "
+                f"({self.confidence:.0%} CI {self.low:,.0f} .. {self.high:,.0f}; "
+                f"{self.successes}/{self.walks} walks in {self.elapsed:.3f}s)")
+
+
+class _Welford:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def stderr(self) -> float:
+        if self.n < 2:
+            return float("inf")
+        return math.sqrt(self.m2 / (self.n - 1) / self.n)
+
+
+def _run_walks(walk: Callable[[], float], time_budget: float, max_walks: Optional[int],
+               confidence: float) -> CardinalityEstimate:
+    stats = _Welford()
+    successes = 0
+    start = time.time()
+    deadline = start + time_budget
+    # check the clock every 64 walks, a walk is only a few microseconds
+    while max_walks is None or stats.n < max_walks:
+        if stats.n % 64 == 0 and time.time() >= deadline:
+            break
+        x = walk()
+        if x:
+            successes += 1
+        stats.add(x)
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half = z * stats.stderr()
+    return CardinalityEstimate(
+        estimate=stats.mean,
+        low=max(0.0, stats.mean - half),
+        high=stats.mean + half,
+        walks=stats.n,
+        successes=successes,
+        elapsed=time.time() - start,
+        confidence=confidence,
+    )
+
+
+# ---------------------------------------------------------------
+# Walks over the adjacency indexes (generic_join.build_indexes)
+# ---------------------------------------------------------------
+def walk_plan(schemas: Dict[str, List[str]], attr_order: List[str]):
+    """
+    Derive a walk from the schema: start at the first relation, extend
+    to one unbound variable at a time (in attr_order) through a relation
+    with exactly one bound attribute, and check every other relation as
+    soon as both of its attributes are bound.
+
+    :return: (start_rel, steps) where each step is
+             ("extend", rel, from_attr, to_attr) or ("check", rel, a, b)
+    """
+    rels = list(schemas)
+    start = rels[0]
+    bound = list(schemas[start])
+    used = {start}
+    steps = []
+
+    def add_checks():
+        for r in rels:
+            if r not in used and all(a in bound for a in schemas[r]):
+                a, b = schemas[r]
+                steps.append(("check", r, a, b))
+                used.add(r)
+
+    add_checks()
+    for var in attr_order:
+        if var in bound:
+            continue
+        rel = next(r for r in rels if r not in used and var in schemas[r]
+                   and any(a in bound for a in schemas[r]))
+        frm = next(a for a in schemas[rel] if a != var)
+        steps.append(("extend", rel, frm, var))
+        used.add(rel)
+        bound.append(var)
+        add_checks()
+    return start, steps
+
+
+def estimate_output_size(relations: Dict[str, List[Tuple[int, ...]]],
+                         index: Dict[Tuple[str, str], Dict[int, set]],
+                         schemas: Dict[str, List[str]],
+                         attr_order: List[str],
+                         time_budget: float = DEFAULT_TIME_BUDGET,
+                         max_walks: Optional[int] = None,
+                         confidence: float = DEFAULT_CONFIDENCE,
+                         seed: Optional[int] = None) -> CardinalityEstimate:
+    """
+    Wander-join estimate of |q| using the adjacency maps produced by
+    generic_join.build_indexes / fhw_lazy.build_global_indexes.
+    """
+    rng = random.Random(seed)
+    start, steps = walk_plan(schemas, attr_order)
+    start_rows = list(dict.fromkeys(relations[start]))
+    start_attrs = schemas[start]
+    if not start_rows:
+        return CardinalityEstimate(0.0, 0.0, 0.0, 0, 0, 0.0, confidence)
+
+    # random.choice needs a sequence; convert neighbour sets lazily, once
+    seq_cache: Dict[Tuple[str, str, int], tuple] = {}
+
+    def neighbours(rel, attr, val):
+        key = (rel, attr, val)
+        seq = seq_cache.get(key)
+        if seq is None:
+            seq = tuple(index[(rel, attr)].get(val, ()))
+            seq_cache[key] = seq
+        return seq
+
+    n_start = len(start_rows)
+
+    def walk() -> float:
+        assign = dict(zip(start_attrs, start_rows[rng.randrange(n_start)]))
+        inv_p = float(n_start)
+        for kind, rel, a, b in steps:
+            if kind == "check":
+                if assign[b] not in index[(rel, a)].get(assign[a], ()):
+                    return 0.0
+            else:
+                seq = neighbours(rel, a, assign[a])
+                if not seq:
+                    return 0.0
+                inv_p *= len(seq)
+                assign[b] = seq[rng.randrange(len(seq))]
+        return inv_p
+
+    return _run_walks(walk, time_budget, max_walks, confidence)
+
+
+# ---------------------------------------------------------------
+# Walks over the reduced bag tree (ghw_join)
+# ---------------------------------------------------------------
+def estimate_from_bag_tree(bags, tables, child_indexes, root: str = "B1",
+                           time_budget: float = DEFAULT_TIME_BUDGET,
+                           max_walks: Optional[int] = None,
+                           confidence: float = DEFAULT_CONFIDENCE,
+                           seed: Optional[int] = None) -> CardinalityEstimate:
+    """
+    Same estimator on the semijoin-reduced bag tables: pick a uniform
+    root row, then for every child a uniform row among those matching
+    the parent (through ghw_join.build_child_indexes). On a fully
+    reduced tree almost every walk succeeds, so few walks are needed.
+    """
+    rng = random.Random(seed)
+    root_rows = tables[root]
+    if not root_rows:
+        return CardinalityEstimate(0.0, 0.0, 0.0, 0, 0, 0.0, confidence)
+
+    def visit(b, row, assign) -> float:
+        for v in bags[b].vars:
+            if v in assign and assign[v] != row[v]:
+                return 0.0
+            assign[v] = row[v]
+        inv_p = 1.0
+        for c in bags[b].children:
+            shared, idx = child_indexes[c]
+            matches = idx.get(tuple(assign[v] for v in shared))
+            if not matches:
+                return 0.0
+            inv_p *= len(matches)
+            sub = visit(c, matches[rng.randrange(len(matches))], assign)
+            if not sub:
+                return 0.0
+            inv_p *= sub
+        return inv_p
+
+    def walk() -> float:
+        return len(root_rows) * visit(root, root_rows[rng.randrange(len(root_rows))], {})
+
+    return _run_walks(walk, time_budget, max_walks, confidence)
+
+
+def check_output_limit(estimate: CardinalityEstimate, limit: int):
+    """Refuse a query whose estimated output is above `limit` rows."""
+    if estimate.low > limit:
+        raise OutputTooLargeError(f"Query would return {estimate}, limit is {limit:,} rows")
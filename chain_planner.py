@@ -0,0 +1,251 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Cardinality-aware planning for line (chain) queries
+#   R_0(A_0, A_1) ⋈ R_1(A_1, A_2) ⋈ ... ⋈ R_{k-1}(A_{k-1}, A_k)
+#
+# problem3_algo always joins left to right starting from R_0. Here every
+# contiguous interval R_i..R_j gets a cardinality estimate from key-degree
+# statistics, and dynamic programming over the split points picks the
+# join tree (left-deep, right-deep or bushy) with the smallest total
+# intermediate size. Executing the plan records the actual size of every
+# intermediate, so estimates and actuals can be compared.
+
+
+@dataclass
+class RelationStats:
+    size: int
+    left_deg: Counter    # value of the first column -> number of tuples
+    right_deg: Counter   # value of the second column -> number of tuples
+
+
+@dataclass
+class JoinNode:
+    lo: int                          # first relation index in this subtree
+    hi: int                          # last relation index in this subtree
+    estimate: float
+    cost: float                      # estimated sum of intermediate sizes
+    left: Optional["JoinNode"] = None
+    right: Optional["JoinNode"] = None
+    actual: Optional[int] = None     # filled in by execute_plan
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.left is None
+
+    def label(self) -> str:
+        if self.is_leaf:
+            return f"R{self.lo + 1}"
+        return f"R{self.lo + 1}..R{self.hi + 1}"
+
+
+def collect_stats(db) -> List[RelationStats]:
+    """
+    Key-degree statistics for each relation of the chain.
+
+    :param db: list of binary relations (lists of 2-element rows)
+    """
+    return [RelationStats(len(rel), Counter(r[0] for r in rel), Counter(r[1] for r in rel))
+            for rel in db]
+
+
+def junction_sizes(stats: List[RelationStats]) -> List[int]:
+    """
+    J[m] = |R_{m-1} ⋈ R_m| for m >= 1, computed exactly from the degrees
+    of the shared attribute A_m. J[0] is unused.
+    """
+    sizes = [0]
+    for m in range(1, len(stats)):
+        right, left = stats[m - 1].right_deg, stats[m].left_deg
+        if len(left) < len(right):
+            right, left = left, right
+        sizes.append(sum(d * left.get(k, 0) for k, d in right.items()))
+    return sizes
+
+
+def interval_estimates(stats: List[RelationStats]) -> List[List[float]]:
+    """
+    est[i][j] = estimated |R_i ⋈ ... ⋈ R_j|.
+
+    Pairs of adjacent relations are exact (junction_sizes). Longer
+    intervals assume that what happens at one junction is independent of
+    the others, which gives
+        est[i][j] = J[i+1] * ... * J[j] / (|R_{i+1}| * ... * |R_{j-1}|)
+    The estimate does not depend on where an interval is split, so every
+    plan for the same interval is costed with the same number.
+    """
+    k = len(stats)
+    J = junction_sizes(stats)
+    est = [[0.0] * k for _ in range(k)]
+    for i in range(k):
+        est[i][i] = float(stats[i].size)
+        for j in range(i + 1, k):
+            if j == i + 1:
+                est[i][j] = float(J[j])
+            elif stats[j - 1].size:
+                est[i][j] = est[i][j - 1] * J[j] / stats[j - 1].size
+    return est
+
+
+def plan_chain(db, shape: Optional[str] = None,
+               stats: Optional[List[RelationStats]] = None) -> JoinNode:
+    """
+    Choose a join tree for the chain by dynamic programming over intervals,
+    minimizing the estimated sum of intermediate result sizes (C_out).
+
+    :param db: list of binary relations, R_i joins R_{i+1} on R_i[1] = R_{i+1}[0]
+    :param shape: None (any tree, bushy included), "left-deep" or "right-deep"
+    :param stats: precomputed collect_stats(db)
+    """
+    if shape not in (None, "left-deep", "right-deep"):
+        raise ValueError(f"Unknown plan shape: {shape}")
+    stats = stats or collect_stats(db)
+    est = interval_estimates(stats)
+    k = len(db)
+
+    best: Dict[Tuple[int, int], JoinNode] = {}
+    for i in range(k):
+        best[(i, i)] = JoinNode(i, i, est[i][i], 0.0)
+
+    for length in range(2, k + 1):
+        for i in range(0, k - length + 1):
+            j = i + length - 1
+            # split after m: left = R_i..R_m, right = R_{m+1}..R_j
+            if shape == "left-deep":
+                splits = [j - 1]
+            elif shape == "right-deep":
+                splits = [i]
+            else:
+                splits = range(i, j)
+            choice = None
+            for m in splits:
+                left, right = best[(i, m)], best[(m + 1, j)]
+                # the full result is produced by every plan, only count
+                # intermediates below the root
+                cost = left.cost + right.cost
+                if length < k:
+                    cost += est[i][j]
+                if choice is None or cost < choice.cost:
+                    choice = JoinNode(i, j, est[i][j], cost, left, right)
+            best[(i, j)] = choice
+
+    return best[(0, k - 1)]
+
+
+def plan_shape(node: JoinNode) -> str:
+    """"left-deep", "right-deep" or "bushy" (a 2-relation plan is left-deep)."""
+    left_deep = right_deep = True
+
+    def walk(n):
+        nonlocal left_deep, right_deep
+        if n.is_leaf:
+            return
+        if not n.right.is_leaf:
+            left_deep = False
+        if not n.left.is_leaf:
+            right_deep = False
+        walk(n.left)
+        walk(n.right)
+
+    walk(node)
+    if left_deep:
+        return "left-deep"
+    if right_deep:
+        return "right-deep"
+    return "bushy"
+
+
+def _hash_join(left: List[list], right: List[list]) -> List[list]:
+    """Join on left's last column = right's first column, build on the smaller side."""
+    if not left or not right:
+        return []
+    result = []
+    if len(left) <= len(right):
+        h = {}
+        for row in left:
+            h.setdefault(row[-1], []).append(row)
+        for row in right:
+            matches = h.get(row[0])
+            if matches:
+                tail = row[1:]
+                for l_row in matches:
+                    result.append(l_row + tail)
+    else:
+        h = {}
+        for row in right:
+            h.setdefault(row[0], []).append(row[1:])
+        for row in left:
+            matches = h.get(row[-1])
+            if matches:
+                for tail in matches:
+                    result.append(row + tail)
+    return result
+
+
+def execute_plan(db, plan: JoinNode) -> List[list]:
+    """
+    Evaluate the plan bottom-up with hash joins. Every node's `actual`
+    is set to the size of its result. Rows are lists [a_0, ..., a_k],
+    the same format as problem3_algo.
+    """
+    def run(node):
+        if node.is_leaf:
+            rows = [list(r) for r in db[node.lo]]
+        else:
+            rows = _hash_join(run(node.left), run(node.right))
+        node.actual = len(rows)
+        return rows
+
+    return run(plan)
+
+
+def explain(plan: JoinNode) -> str:
+    """Indented plan tree with estimated and (if executed) actual sizes."""
+    lines = [f"Plan shape: {plan_shape(plan)}, estimated intermediate cost: {plan.cost:,.0f}"]
+
+    def walk(node, depth):
+        actual = "" if node.actual is None else f", actual {node.actual:,}"
+        op = "scan" if node.is_leaf else "join"
+        lines.append(f"{'  ' * depth}{op} {node.label()}: est {node.estimate:,.0f}{actual}")
+        if not node.is_leaf:
+            walk(node.left, depth + 1)
+            walk(node.right, depth + 1)
+
+    walk(plan, 0)
+    return "\n".join(lines)
+
+
+def planned_chain_join(db, shape: Optional[str] = None, report: bool = False) -> List[list]:
+    """Drop-in alternative to problem3_algo that plans before joining."""
+    plan = plan_chain(db, shape)
+    result = execute_plan(db, plan)
+    if report:
+        print(explain(plan))
+    return result
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from problem3 import problem3_algo
+
+    # Problem 5 data: two hubs (5 and 7) of 1,000 tuples each on both
+    # sides of A2, and a single tuple chain 2001 -> 2002 -> 8 -> 30
+    R1 = [[i, 5] for i in range(1, 1001)] + [[i, 7] for i in range(1001, 2001)] + [[2001, 2002]]
+    R2 = [[5, i] for i in range(1, 1001)] + [[7, i] for i in range(1001, 2001)] + [[2002, 8]]
+    R3 = [[random.randint(2002, 3000), random.randint(1, 3000)] for _ in range(2000)] + [[8, 30]]
+    db = [R1, R2, R3]
+
+    for shape in ("left-deep", "right-deep", None):
+        plan = plan_chain(db, shape)
+        start = time.perf_counter()
+        result = execute_plan(db, plan)
+        elapsed = time.perf_counter() - start
+        print(f"--- shape={shape or 'any'}: {len(result)} rows in {elapsed:.4f}s")
+        print(explain(plan))
+
+    start = time.perf_counter()
+    baseline = problem3_algo(db)
+    print(f"--- problem3_algo (left to right): {len(baseline)} rows "
+          f"in {time.perf_counter() - start:.4f}s")
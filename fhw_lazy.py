@@ -1,8 +1,12 @@
-import csv
 import time
+import operator
 from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Dict, List, Tuple, Set, Optional
+from index_cache import get_index_manager, relation_sources
+from ingest import ingest_relations
+from bitmap_index import Dictionary, build_bitmap_indexes
+from join_compiler import compile_join
 
 
 
@@ -22,28 +26,13 @@ ATTR_ORDER = ["A1", "A2", "A3", "A4", "A5", "A6"]
 
 #  LOAD RELATIONS
 
-def load_relations(dir_path: str) -> Dict[str, List[Tuple[int, ...]]]:
+def load_relations(dir_path: str, build_index: bool = True) -> Dict[str, List[Tuple[int, ...]]]:
     """
     Loads relations R1..R7 as lists of tuples (ints) from CSV files.
     Each CSV must have headers exactly matching SCHEMAS[rname].
+    With build_index, the set indexes are built while parsing (see ingest.py).
     """
-    base = Path(dir_path)
-    relations: Dict[str, List[Tuple[int, ...]]] = {}
-
-    for rname, schema in SCHEMAS.items():
-        filename = base / f"{rname}.csv"
-        if not filename.exists():
-            raise FileNotFoundError(f"Missing file: {filename}")
-
-        rows: List[Tuple[int, ...]] = []
-        with open(filename, newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                tup = tuple(int(row[attr]) for attr in schema)
-                rows.append(tup)
-        relations[rname] = rows
-
-    return relations
+    return ingest_relations(dir_path, SCHEMAS, build_index=build_index)
 
 
 
@@ -117,7 +106,8 @@ def build_fractional_bags() -> Dict[str, FBag]:
 
 #  GLOBAL INDEXES (FIX 1)
 
-def build_global_indexes(relations: Dict[str, List[Tuple[int, ...]]]):
+def build_global_indexes(relations: Dict[str, List[Tuple[int, ...]]],
+                         sources: Optional[Dict[str, Path]] = None):
     """
     Build global projections and adjacency maps once.
 
@@ -125,30 +115,11 @@ def build_global_indexes(relations: Dict[str, List[Tuple[int, ...]]]):
     index_global[(rel, attr)] = dict[val] -> set[other_attr_values]
         where 'attr' is one of the two attributes of rel, and
         other_attr_values are the values for the *other* attribute.
-    """
-    proj_global: Dict[Tuple[str, str], Set[int]] = {}
-    index_global: Dict[Tuple[str, str], Dict[int, Set[int]]] = {}
-
-    for rel, schema in SCHEMAS.items():
-        a, b = schema
-
-        proj_global[(rel, a)] = set()
-        proj_global[(rel, b)] = set()
 
-        amap: Dict[int, Set[int]] = {}
-        bmap: Dict[int, Set[int]] = {}
-
-        for tup in relations[rel]:
-            av, bv = tup
-            proj_global[(rel, a)].add(av)
-            proj_global[(rel, b)].add(bv)
-            amap.setdefault(av, set()).add(bv)
-            bmap.setdefault(bv, set()).add(av)
-
-        index_global[(rel, a)] = amap
-        index_global[(rel, b)] = bmap
-
-    return proj_global, index_global
+    The maps are owned by the shared index manager (index_cache.py), so
+    they are reused by GenericJoin and reloaded from disk when valid.
+    """
+    return get_index_manager().build_indexes(relations, SCHEMAS, sources)
 
 
 # ===============================================================
@@ -160,6 +131,8 @@ def bag_generic_join(
     proj_global: Dict[Tuple[str, str], Set[int]],
     index_global: Dict[Tuple[str, str], Dict[int, Set[int]]],
     constraints: Optional[Dict[str, int]] = None,
+    compiled: bool = False,
+    dictionaries: Optional[Dict[str, Dictionary]] = None,
 ) -> List[Dict[str, int]]:
     """
     Worst-case optimal join restricted to a single bag.
@@ -170,6 +143,14 @@ def bag_generic_join(
     - constraints : partial assignment from parent bags; any variable
                     in constraints that appears in the bag is fixed.
 
+    The index values may be sets of ints or, for the bitmap encoding,
+    the sets built by bitmap_index; dictionaries then holds the
+    Dictionary of every attribute, which knows how to size, iterate and
+    probe its sets. Constraints and returned rows are plain values.
+
+    compiled=True runs a function generated (and cached) by join_compiler
+    for this bag and set of constrained variables.
+
     Returns:
         list of dicts mapping bag.vars -> int values.
     """
@@ -185,6 +166,13 @@ def bag_generic_join(
         if bag_attrs:
             edges.append((rel, bag_attrs))
 
+    if compiled:
+        fixed = [v for v in vars_order if constraints and v in constraints]
+        bitmap_vars = [v for v in vars_order if dictionaries and dictionaries[v].dense]
+        run = compile_join(vars_order, edges, vars_order, fixed, emit="dict",
+                           bitmap_vars=bitmap_vars)
+        return run(proj_global, index_global, constraints, domains=dictionaries)
+
     results: List[Dict[str, int]] = []
 
     def get_allowed(var: str, prefix: Dict[str, int]) -> List[int]:
@@ -215,30 +203,35 @@ def bag_generic_join(
                 candidate_sets.append(proj_global[(rel, var)])
             else:
                 # Restricted by adjacency from global index
-                neigh_map = index_global[(rel, other)]
-                candidate_sets.append(neigh_map.get(other_val, set()))
+                neigh = index_global[(rel, other)].get(other_val)
+                if neigh is None:
+                    return []
+                candidate_sets.append(neigh)
 
         if not candidate_sets:
             # Var not involved in any relation in this bag
             return []
 
+        if dictionaries is None:
+            size, members, contains = len, sorted, operator.contains
+        else:
+            d = dictionaries[var]
+            size, members, contains = d.size, d.members, d.contains
+
         # Intersect candidate sets (WCOJ-style)
-        candidate_sets.sort(key=len)
-        vals = set(candidate_sets[0])
+        candidate_sets.sort(key=size)
+        vals = candidate_sets[0]
         for s in candidate_sets[1:]:
-            vals &= s
+            vals = vals & s
             if not vals:
                 break
 
         # Apply constraint if var is fixed by parent
         if constraints and var in constraints:
             fixed = constraints[var]
-            if fixed in vals:
-                vals = {fixed}
-            else:
-                vals = set()  # no possible value
+            return [fixed] if contains(vals, fixed) else []  # no possible value
 
-        return sorted(vals)
+        return members(vals)
 
     def recurse(i: int, prefix: Dict[str, int]):
         if i == len(vars_order):
@@ -273,18 +266,32 @@ def enumerate_fhw(
     proj_global: Dict[Tuple[str, str], Set[int]],
     index_global: Dict[Tuple[str, str], Dict[int, Set[int]]],
     root: str = "B1",
+    dictionaries: Optional[Dict[str, Dictionary]] = None,
+    compiled: bool = False,
+    sink=None,
 ) -> List[Tuple[int, ...]]:
     """
     Enumerate full results of the query using:
       - root bag evaluated once,
       - all other bags evaluated lazily given parent assignments,
       - global indexes (no rescanning of relations).
+
+    If dictionaries is given, the indexes are bitmap_index sets and the
+    dictionaries are passed on to every bag join.
+
+    sink: optional result_sink.ResultSink receiving each (distinct)
+    output row as soon as it is found; it is returned instead of the
+    result list.
     """
 
     results: List[Tuple[int, ...]] = []
+    emit = sink.write if sink is not None else results.append
+    # De-duplicate just in case
+    seen: Set[Tuple[int, ...]] = set()
 
     root_bag = bags[root]
-    root_rows = bag_generic_join(root_bag, proj_global, index_global, constraints=None)
+    root_rows = bag_generic_join(root_bag, proj_global, index_global, constraints=None,
+                                 compiled=compiled, dictionaries=dictionaries)
 
     def dfs(bname: str, assignment: Dict[str, int]):
         bag = bags[bname]
@@ -293,7 +300,8 @@ def enumerate_fhw(
         if bname == root:
             rows = root_rows
         else:
-            rows = bag_generic_join(bag, proj_global, index_global, constraints=assignment)
+            rows = bag_generic_join(bag, proj_global, index_global, constraints=assignment,
+                                    compiled=compiled, dictionaries=dictionaries)
 
         shared = [v for v in bag.vars if v in assignment]
 
@@ -311,33 +319,46 @@ def enumerate_fhw(
                 if bag.name == "B4":
                     # Emit full tuple only if all attributes are present
                     if all(a in extended for a in ATTR_ORDER):
-                        results.append(tuple(extended[a] for a in ATTR_ORDER))
+                        out = tuple(extended[a] for a in ATTR_ORDER)
+                        if out not in seen:
+                            seen.add(out)
+                            emit(out)
             else:
                 for child_name in bag.children:
                     dfs(child_name, extended)
 
     dfs(root, {})
-    # De-duplicate just in case
-    results = list(dict.fromkeys(results))
-    return results
+    return sink if sink is not None else results
 
 
 
 #  MAIN: FHW EVALUATION 
 
-def fhw_lazy_evaluate(relations_dir: str = "query_relations") -> List[Tuple[int, ...]]:
+def fhw_lazy_evaluate(relations_dir: str = "query_relations",
+                      encoding: Optional[str] = None,
+                      compiled: bool = False) -> List[Tuple[int, ...]]:
     print("Loading relations...")
-    relations = load_relations(relations_dir)
+    relations = load_relations(relations_dir, build_index=encoding is None)
 
     print("Building fractional hypertree decomposition...")
     bags = build_fractional_bags()
 
-    print("Building global indexes (projections + adjacency)...")
-    proj_global, index_global = build_global_indexes(relations)
+    dictionaries = None
+    if encoding is None:
+        print("Building global indexes (projections + adjacency)...")
+        proj_global, index_global = build_global_indexes(
+            relations, relation_sources(relations_dir, SCHEMAS)
+        )
+    elif encoding == "bitmap":
+        print("Building dictionary-encoded bitmap indexes...")
+        dictionaries, proj_global, index_global = build_bitmap_indexes(relations, SCHEMAS)
+    else:
+        raise ValueError(f"Unknown encoding: {encoding}")
 
     print("Running FHW evaluation (bag-local WCOJ with global indexes)...")
     start = time.time()
-    output = enumerate_fhw(bags, proj_global, index_global, root="B1")
+    output = enumerate_fhw(bags, proj_global, index_global, root="B1",
+                           dictionaries=dictionaries, compiled=compiled)
     end = time.time()
 
     print(f"Number of result tuples: {len(output)}")
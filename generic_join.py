@@ -1,7 +1,8 @@
-import csv
 import time
-from pathlib import Path
-from typing import Dict, List, Tuple, Set
+from index_cache import get_index_manager, relation_sources
+from ingest import ingest_relations
+from bitmap_index import build_bitmap_indexes
+from join_compiler import compile_join
 
 
 # ---------------------------------------------------------------
@@ -23,57 +24,75 @@ ATTR_ORDER = ["A1", "A2", "A3", "A4", "A5", "A6"]
 # ---------------------------------------------------------------
 # LOAD RELATIONS
 # ---------------------------------------------------------------
-def load_relations(dir_path: str):
-    base = Path(dir_path)
-    relations = {}
-
-    for rname, schema in SCHEMAS.items():
-        filename = base / f"{rname}.csv"
-        rows = []
-        with open(filename, newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                rows.append(tuple(int(row[attr]) for attr in schema))
-        relations[rname] = rows
-
-    return relations
+def load_relations(dir_path: str, build_index: bool = True):
+    # Parsed in chunks with the indexes built in the same pass (ingest);
+    # build_indexes below then finds them in the index manager. Callers
+    # that never use the set indexes (e.g. the bitmap encoding) pass
+    # build_index=False.
+    return ingest_relations(dir_path, SCHEMAS, build_index=build_index)
 
 
 # ---------------------------------------------------------------
 # INDEX CONSTRUCTION
 # ---------------------------------------------------------------
-def build_indexes(relations):
-    proj_all = {}
-    index = {}
-
-    for rname, schema in SCHEMAS.items():
-        X, Y = schema
-        proj_all[(rname, X)] = set()
-        proj_all[(rname, Y)] = set()
+def build_indexes(relations, sources=None):
+    # Shared with the other engines through the index manager, so the
+    # projections/adjacency maps are built once per relation content.
+    return get_index_manager().build_indexes(relations, SCHEMAS, sources)
 
-        XY_map = {}
-        YX_map = {}
 
-        for x, y in relations[rname]:
-            proj_all[(rname, X)].add(x)
-            proj_all[(rname, Y)].add(y)
-            XY_map.setdefault(x, set()).add(y)
-            YX_map.setdefault(y, set()).add(x)
+# ---------------------------------------------------------------
+# GENERIC JOIN CORE
+# ---------------------------------------------------------------
+def generic_join(relations, sources=None, encoding=None, compiled=False, sink=None,
+                 bitmap_indexes=None):
+    """
+    encoding=None uses the shared set-of-ints indexes; encoding="bitmap"
+    stores the sets of dense attributes as int bitmaps over dictionary
+    codes (bitmap_index), so intersections are big-int ANDs and sorted
+    member lists are memoized instead of re-sorted.
 
-        index[(rname, X)] = XY_map
-        index[(rname, Y)] = YX_map
+    compiled=True runs a nested-loop function generated for this plan
+    (join_compiler) instead of the recursive interpreter below.
 
-    return proj_all, index
+    sink: a result_sink.ResultSink that receives every row; it is
+    returned instead of a list.
 
+    bitmap_indexes: the (dictionaries, proj_all, index) of
+    build_bitmap_indexes(relations, SCHEMAS), if the caller keeps them;
+    otherwise encoding="bitmap" builds them on every call.
+    """
+    if encoding is None:
+        proj_all, index = build_indexes(relations, sources)
+        dictionaries = None
+    elif encoding == "bitmap":
+        if bitmap_indexes is None:
+            bitmap_indexes = build_bitmap_indexes(relations, SCHEMAS)
+        dictionaries, proj_all, index = bitmap_indexes
+    else:
+        raise ValueError(f"Unknown encoding: {encoding}")
+
+    emit = sink.write if sink is not None else None
+
+    if compiled:
+        bitmap_vars = [a for a, d in (dictionaries or {}).items() if d.dense]
+        run = compile_join(ATTR_ORDER, list(SCHEMAS.items()), ATTR_ORDER,
+                           bitmap_vars=bitmap_vars)
+        results = run(proj_all, index, append=emit, domains=dictionaries)
+        return sink if sink is not None else results
 
-# ---------------------------------------------------------------
-# GENERIC JOIN CORE
-# ---------------------------------------------------------------
-def generic_join(relations):
-    proj_all, index = build_indexes(relations)
     results = []
+    if emit is None:
+        emit = results.append
+
+    # (empty set, size, sorted members) for the sets of each attribute
+    if dictionaries is None:
+        set_ops = {a: (set(), len, sorted) for a in ATTR_ORDER}
+    else:
+        set_ops = {a: (d.empty, d.size, d.members) for a, d in dictionaries.items()}
 
     def get_allowed(var, prefix):
+        empty, size, members = set_ops[var]
         candidate_sets = []
 
         for rname, schema in SCHEMAS.items():
@@ -85,22 +104,22 @@ def generic_join(relations):
                 candidate_sets.append(proj_all[(rname, var)])
             else:
                 ov = prefix[other]
-                candidate_sets.append(index[(rname, other)].get(ov, set()))
+                candidate_sets.append(index[(rname, other)].get(ov, empty))
 
         if not candidate_sets:
             return []
 
-        candidate_sets.sort(key=len)
-        values = set(candidate_sets[0])
+        candidate_sets.sort(key=size)
+        values = candidate_sets[0]
         for s in candidate_sets[1:]:
-            values &= s
+            values = values & s
             if not values:
                 break
-        return sorted(values)
+        return members(values)
 
     def recurse(i, prefix):
         if i == len(ATTR_ORDER):
-            results.append(tuple(prefix[a] for a in ATTR_ORDER))
+            emit(tuple(prefix[a] for a in ATTR_ORDER))
             return
         var = ATTR_ORDER[i]
         for v in get_allowed(var, prefix):
@@ -109,7 +128,7 @@ def generic_join(relations):
             del prefix[var]
 
     recurse(0, {})
-    return results
+    return sink if sink is not None else results
 
 def generic_join_subquery(vars_in_order, edges, relations):
     """
@@ -121,50 +140,30 @@ def generic_join_subquery(vars_in_order, edges, relations):
     # Build a local schema dictionary
     local_schemas = {rel: attrs for rel, attrs in edges}
 
-    # Build projection information and indexes
+    # Projection information and indexes come from the shared index
+    # manager, so a base relation that appears in several bags (or in
+    # several runs) is only indexed once; filtered or derived row lists
+    # are indexed here and not cached.
+    manager = get_index_manager()
     proj_all = {}
     index = {}
 
-    # Normalize relations into row dicts
-    normalized = {}
     for rel, attrs in edges:
-        normalized_rows = []
-        for tup in relations[rel]:
-            # Relation may be tuple or dict
-            if isinstance(tup, dict):
-                normalized_rows.append({a: tup[a] for a in attrs})
-            else:
-                normalized_rows.append({a: v for a, v in zip(attrs, tup)})
-        normalized[rel] = normalized_rows
-
-        # Build projection sets
+        rows = relations[rel]
+        # Normalize into tuples ordered like attrs, unless they already are
+        # (keeps the caller's list, so the manager recognizes it cheaply)
+        if rows and not (isinstance(rows[0], tuple) and len(rows[0]) == len(attrs)):
+            rows = [
+                tuple(tup[a] for a in attrs) if isinstance(tup, dict)
+                else tuple(tup[:len(attrs)])
+                for tup in rows
+            ]
+
+        proj, adj = manager.relation_index(rel, attrs, rows)
         for a in attrs:
-            proj_all[(rel, a)] = set()
-
-    # Build indexes
-    for rel, attrs in edges:
-        rows = normalized[rel]
-        if len(attrs) == 1:
-            # unary case
-            a = attrs[0]
-            for row in rows:
-                proj_all[(rel, a)].add(row[a])
-            continue
-
-        # binary or higher (our bags are binary)
-        a, b = attrs
-        a_map = {}
-        b_map = {}
-        for row in rows:
-            av = row[a]
-            bv = row[b]
-            proj_all[(rel, a)].add(av)
-            proj_all[(rel, b)].add(bv)
-            a_map.setdefault(av, set()).add(bv)
-            b_map.setdefault(bv, set()).add(av)
-
-        index[(rel, a)] = a_map
-        index[(rel, b)] = b_map
+            proj_all[(rel, a)] = proj[a]
+            if a in adj:
+                index[(rel, a)] = adj[a]
 
     # Recursive enumeration (copied from your main generic_join, but adapted)
     results = []
@@ -221,14 +220,14 @@ def generic_join_subquery(vars_in_order, edges, relations):
 # ---------------------------------------------------------------
 # TIMING FUNCTIONS FOR EXPERIMENTS
 # ---------------------------------------------------------------
-def run_genericjoin(dirpath):
-    relations = load_relations(dirpath)
-    return generic_join(relations)
+def run_genericjoin(dirpath, encoding=None, compiled=False, sink=None):
+    relations = load_relations(dirpath, build_index=encoding is None)
+    return generic_join(relations, relation_sources(dirpath, SCHEMAS), encoding, compiled, sink)
 
 
-def time_genericjoin(dirpath):
+def time_genericjoin(dirpath, encoding=None, compiled=False, sink=None):
     start = time.time()
-    results = run_genericjoin(dirpath)
+    results = run_genericjoin(dirpath, encoding, compiled, sink)
     end = time.time()
     return end - start, len(results)
 
@@ -3,6 +3,10 @@ import time
 from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Optional, List
+from operator import itemgetter
+from skew_join import find_triangle, heavy_light_triangle
+from bloom_filter import sideways_prefilter
+from ingest import ingest_relations
 
 
 
@@ -141,6 +145,58 @@ def natural_join_hash(t1, t2):
 
 
 
+def join_project(t1, t2, out_attrs, distinct=False):
+    """
+    Pipelined natural join -> projection -> (optional) distinct.
+
+    The smaller input is the build side and only the columns that
+    survive the projection are kept in its hash table; every probe match
+    is emitted already projected to out_attrs, so the unprojected join
+    result is never materialized.
+    """
+    if not t1 or not t2:
+        return []
+
+    common = [a for a in t1[0] if a in t2[0]]
+    build, probe = (t1, t2) if len(t1) <= len(t2) else (t2, t1)
+
+    probe_out = [a for a in out_attrs if a in probe[0]]
+    build_out = [a for a in out_attrs if a in build[0] and a not in probe[0]]
+    concat = probe_out + build_out
+    pick = itemgetter(*[concat.index(a) for a in out_attrs])
+    single = len(out_attrs) == 1
+
+    # Build: join key -> projected payloads of the build side
+    # (de-duplicated per key already when distinct output is requested)
+    hash_tbl = {}
+    for row in build:
+        key = tuple(row[a] for a in common)
+        payload = tuple(row[a] for a in build_out)
+        if distinct:
+            hash_tbl.setdefault(key, {})[payload] = None
+        else:
+            hash_tbl.setdefault(key, []).append(payload)
+
+    out = []
+    seen = set()
+    for r in probe:
+        matches = hash_tbl.get(tuple(r[a] for a in common))
+        if not matches:
+            continue
+        pvals = tuple(r[a] for a in probe_out)
+        for bvals in matches:
+            vals = pick(pvals + bvals)
+            if single:
+                vals = (vals,)
+            if distinct:
+                if vals in seen:
+                    continue
+                seen.add(vals)
+            out.append(dict(zip(out_attrs, vals)))
+
+    return out
+
+
 def project(table, attrs):
     return [{a: row[a] for a in attrs} for row in table]
 
@@ -162,23 +218,81 @@ def semijoin_fast(outer, inner, attrs):
 
 # Bag-table construction
 
-def build_bag_tables(bags, relations):
+def covered_edges(bag, bags):
+    """
+    All relations (from any bag) whose attributes lie inside this bag,
+    e.g. R1, R2 and R3 for B1. If they form a cycle, the bag can be
+    built as the full cyclic join instead of R1 ⋈ R2 alone.
+    """
+    edges = []
+    for other in bags.values():
+        for r in other.lambdas:
+            attrs = SCHEMAS[r]
+            if all(a in bag.vars for a in attrs) and (r, attrs) not in edges:
+                edges.append((r, attrs))
+    return edges
+
+
+def build_bag_tables(bags, relations, skew_aware=False, skew_stats=None):
     tables = {}
 
     for bname, bag in bags.items():
-        rels = bag.lambdas
-        table = relations[rels[0]]
-        for r in rels[1:]:
-            table = natural_join_hash(table, relations[r])
-        # Project to bag vars
-        tables[bname] = [
-            {a: row[a] for a in bag.vars}
-            for row in table
-        ]
+        if skew_aware:
+            # The bag's own relations first: they become the two joined
+            # sides (and carry the multiplicities), the third only filters
+            edges = sorted(covered_edges(bag, bags), key=lambda e: e[0] not in bag.lambdas)
+            tri = find_triangle(edges)
+            if tri is not None and {tri[0][0], tri[1][0]} == set(bag.lambdas):
+                # Cyclic bag: heavy/light split keeps it within the AGM bound
+                stats = {}
+                tables[bname] = heavy_light_triangle(bag.vars, edges, relations, stats=stats)
+                if skew_stats is not None:
+                    skew_stats[bname] = stats
+                continue
+
+        tables[bname] = build_bag_table(bag, relations)
 
     return tables
 
 
+def bag_join_order(bag, relations):
+    """
+    Smallest relation first, then always the smallest relation that
+    shares an attribute with what has been joined so far (same idea as
+    fhw_join.choose_join_order_fhw, without creating cross products).
+    """
+    remaining = sorted(bag.lambdas, key=lambda r: len(relations[r]))
+    order = [remaining.pop(0)]
+    attrs = set(SCHEMAS[order[0]])
+    while remaining:
+        nxt = next((r for r in remaining if attrs & set(SCHEMAS[r])), remaining[0])
+        remaining.remove(nxt)
+        order.append(nxt)
+        attrs |= set(SCHEMAS[nxt])
+    return order
+
+
+def build_bag_table(bag, relations, distinct=False):
+    """
+    Bag table projected to bag.vars, built with join_project so every
+    intermediate only keeps bag variables and attributes still needed
+    to join the remaining relations.
+    """
+    order = bag_join_order(bag, relations)
+    if len(order) == 1:
+        return project(relations[order[0]], bag.vars)
+
+    table = relations[order[0]]
+    seen_attrs = list(SCHEMAS[order[0]])
+    for i, r in enumerate(order[1:], start=1):
+        seen_attrs += [a for a in SCHEMAS[r] if a not in seen_attrs]
+        needed = set(bag.vars).union(*(SCHEMAS[x] for x in order[i + 1:]))
+        keep = [a for a in bag.vars if a in seen_attrs]
+        keep += [a for a in seen_attrs if a in needed and a not in keep]
+        table = join_project(table, relations[r], keep, distinct)
+    return table
+
+
 
 # Tree traversals and semijoin reductions
 
@@ -251,8 +365,13 @@ def build_child_indexes(bags, tables):
 
 # Enumeration of full results (with child indexes)
 
-def enumerate_results(bags, tables, child_indexes, root="B1"):
+def enumerate_results(bags, tables, child_indexes, root="B1", sink=None):
+    """
+    sink: optional result_sink.ResultSink receiving each output row;
+    it is returned instead of the result list.
+    """
     results = []
+    emit = sink.write if sink is not None else results.append
 
     def dfs_at(b, assign, candidate_rows):
         bag = bags[b]
@@ -273,7 +392,7 @@ def enumerate_results(bags, tables, child_indexes, root="B1"):
             if not bag.children:
                 # Only output full assignments (all A1..A6)
                 if all(a in new_assign for a in ATTR_ORDER):
-                    results.append(tuple(new_assign[a] for a in ATTR_ORDER))
+                    emit(tuple(new_assign[a] for a in ATTR_ORDER))
             else:
                 # Recurse into each child, but ONLY on matching child rows
                 for c in bag.children:
@@ -286,26 +405,27 @@ def enumerate_results(bags, tables, child_indexes, root="B1"):
 
     # Start DFS at root with the full root table as candidates
     dfs_at(root, {}, tables[root])
-    return results
+    return sink if sink is not None else results
 
 
 
 
 # run_ghw + time_ghw to track the time.
-def run_ghw(dirpath):
-    relations = load_relations(dirpath)
+def run_ghw(dirpath, skew_aware=False, bloom=False, bloom_stats=None, sink=None):
     bags = build_bags()
 
-    # Precompute all relational tables ONCE (as dict rows)
-    rel_tables = {
-        r: relation_to_rows(r, relations)
-        for r in relations
-    }
+    # Parse all relational tables ONCE, straight into dict rows
+    rel_tables = ingest_relations(dirpath, SCHEMAS, build_index=False, row_format="dict")
+
+    # Optional approximate pre-filter: Bloom filters on the join attributes,
+    # pushed along the tree before any bag table exists
+    if bloom:
+        rel_tables = sideways_prefilter(bags, rel_tables, SCHEMAS, stats=bloom_stats)
 
     # Build bag tables (already projected to bag.vars)
-    tables = build_bag_tables(bags, rel_tables)
+    tables = build_bag_tables(bags, rel_tables, skew_aware)
 
-    # Semijoin reductions
+    # Semijoin reductions (exact, so Bloom false positives are removed here)
     bottom_up(bags, tables)
     top_down(bags, tables)
 
@@ -313,12 +433,12 @@ def run_ghw(dirpath):
     child_indexes = build_child_indexes(bags, tables)
 
     # Enumerate final results
-    return enumerate_results(bags, tables, child_indexes)
+    return enumerate_results(bags, tables, child_indexes, sink=sink)
 
 
-def time_ghw(dirpath):
+def time_ghw(dirpath, skew_aware=False, bloom=False, sink=None, bloom_stats=None):
     start = time.time()
-    out = run_ghw(dirpath)
+    out = run_ghw(dirpath, skew_aware, bloom, bloom_stats, sink=sink)
     end = time.time()
     return end - start, len(out)
 
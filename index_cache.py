@@ -0,0 +1,287 @@
+import hashlib
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple, Set, Optional, Any
+
+
+# ---------------------------------------------------------------
+# SHARED, PERSISTENT INDEX CACHE
+#
+# Every engine needs the same two structures per (relation, attribute):
+#   proj[(rel, attr)]  = set of values of attr in rel
+#   index[(rel, attr)] = dict[val] -> set of values of the *other* attr
+# The IndexManager builds them once per base relation (a relation file)
+# and hands the same objects to GenericJoin, the FHW bag joins and every
+# bag of generic_join_subquery. Indexed relations are treated as
+# read-only. Ad-hoc row lists (filtered or derived relations) are
+# indexed on the spot and never cached or persisted: they are rarely
+# seen twice, and caching them would mean hashing their contents.
+# ---------------------------------------------------------------
+CACHE_VERSION = 1
+
+
+def relation_sources(dir_path: str, schemas: Dict[str, List[str]]) -> Dict[str, Path]:
+    """
+    Map each relation name to the CSV file it is loaded from, so the
+    manager can validate persisted indexes by file mtime/size instead
+    of hashing the relation contents.
+    """
+    base = Path(dir_path)
+    return {rname: base / f"{rname}.csv" for rname in schemas}
+
+
+def build_relation_index(attrs: List[str], rows):
+    """
+    Build projections and adjacency maps for one relation.
+
+    :param attrs: attribute names of the (unary or binary) relation
+    :param rows: iterable of tuples in the order of attrs
+    :return: (proj, adj) where proj[attr] is a set of values and
+             adj[attr] maps a value of attr to the set of values of the
+             other attribute (empty for unary relations).
+    """
+    proj: Dict[str, Set[int]] = {a: set() for a in attrs}
+    adj: Dict[str, Dict[int, Set[int]]] = {}
+
+    if len(attrs) == 1:
+        a = attrs[0]
+        proj[a].update(tup[0] for tup in rows)
+        return proj, adj
+
+    a, b = attrs
+    a_proj, b_proj = proj[a], proj[b]
+    a_map: Dict[int, Set[int]] = {}
+    b_map: Dict[int, Set[int]] = {}
+    for tup in rows:
+        av, bv = tup[0], tup[1]
+        a_proj.add(av)
+        b_proj.add(bv)
+        a_map.setdefault(av, set()).add(bv)
+        b_map.setdefault(bv, set()).add(av)
+
+    adj[a] = a_map
+    adj[b] = b_map
+    return proj, adj
+
+
+class IndexManager:
+    """
+    Process-wide cache of relation indexes, optionally persisted to disk.
+
+    Entries are keyed by a fingerprint of the source file (path, mtime,
+    size and row count) and only one entry is kept per file. The rows
+    list an entry was built or registered for is remembered, so callers
+    that pass the same list without its source still hit. A persisted
+    entry is only reused if its stored fingerprint matches.
+
+    Safe to share between threads (the query server runs queries on a
+    thread pool): the in-memory tables and stats are guarded by a lock,
+    which is not held while an index is built or read from disk.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: Dict[Tuple, Tuple[Dict, Dict]] = {}
+        # (rel, attrs) -> (rows, fingerprint) of the last file-backed list
+        self._fingerprints: Dict[Tuple[str, Tuple[str, ...]], Tuple[Any, Tuple]] = {}
+        self.stats = {"hits": 0, "disk_hits": 0, "builds": 0, "uncached": 0}
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------
+    # Fingerprints
+    # -----------------------------------------------------------
+    @staticmethod
+    def _file_identity(rname: str, attrs: Tuple[str, ...], source: Optional[Path]):
+        """File fingerprint without the row count, or None without a file."""
+        if source is None or not source.exists():
+            return None
+        st = source.stat()
+        return ("file", rname, attrs, str(source.resolve()), st.st_mtime_ns, st.st_size)
+
+    def _fingerprint(self, rname: str, attrs: Tuple[str, ...], rows,
+                     source: Optional[Path]) -> Optional[Tuple]:
+        """
+        Fingerprint of the file rows were loaded from, or of the file the
+        same list was last indexed for; None for ad-hoc rows.
+        """
+        ident = self._file_identity(rname, attrs, source)
+        if ident is not None:
+            return ident + (len(rows),)
+
+        memo = self._fingerprints.get((rname, attrs))
+        if memo is not None and memo[0] is rows:
+            return memo[1]
+        return None
+
+    def _cache_path(self, fp: Tuple) -> Path:
+        # Named after the file (not its mtime) so a stale index is
+        # overwritten instead of accumulating next to the new one.
+        name = hashlib.sha1(repr(fp[:4]).encode()).hexdigest()[:20]
+        return self.cache_dir / f"{fp[1]}-{name}.idx.pkl"
+
+    def _remember(self, fp: Tuple, rows, entry):
+        # caller holds self._lock
+        # one entry per file: drop the indexes of its older versions
+        for old in [k for k in self._entries if k[:4] == fp[:4] and k != fp]:
+            del self._entries[old]
+        self._entries[fp] = entry
+        self._fingerprints[(fp[1], fp[2])] = (rows, fp)
+
+    # -----------------------------------------------------------
+    # Disk persistence
+    # -----------------------------------------------------------
+    def _read(self, fp: Tuple) -> Optional[Dict]:
+        if self.cache_dir is None:
+            return None
+        path = self._cache_path(fp)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if payload.get("version") != CACHE_VERSION:
+            return None
+        return payload
+
+    def _load(self, fp: Tuple):
+        payload = self._read(fp)
+        if payload is None or payload.get("fingerprint") != fp:
+            return None
+        return payload["proj"], payload["adj"]
+
+    def _store(self, fp: Tuple, proj, adj):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_path(fp)
+        tmp = path.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+        payload = {"version": CACHE_VERSION, "fingerprint": fp, "proj": proj, "adj": adj}
+        with open(tmp, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    # -----------------------------------------------------------
+    # Public API
+    # -----------------------------------------------------------
+    def relation_index(self, rname: str, attrs: List[str], rows,
+                       source: Optional[Path] = None):
+        """
+        Return (proj, adj) for one relation, building it at most once.
+        rows must be tuples ordered like attrs. Without a source file (and
+        unless this very list was indexed before) the index is built
+        every time and not kept.
+        """
+        attrs_t = tuple(attrs)
+        with self._lock:
+            fp = self._fingerprint(rname, attrs_t, rows, source)
+            if fp is None:
+                self.stats["uncached"] += 1
+            else:
+                entry = self._entries.get(fp)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    return entry
+        if fp is None:
+            return build_relation_index(list(attrs_t), rows)
+
+        entry = self._load(fp)
+        stat = "disk_hits"
+        if entry is None:
+            stat = "builds"
+            entry = build_relation_index(list(attrs_t), rows)
+            self._store(fp, *entry)
+
+        with self._lock:
+            self.stats[stat] += 1
+            # another thread may have got there first; keep one copy
+            entry = self._entries.get(fp, entry)
+            self._remember(fp, rows, entry)
+        return entry
+
+    def lookup_file(self, rname: str, attrs: List[str], source: Path):
+        """
+        Index of a relation file that is still valid, from memory or disk,
+        before the file has been parsed (so without its row count).
+
+        :return: (fingerprint, proj, adj) or None; the caller must check
+                 the row count in fingerprint[-1] against what it parsed.
+        """
+        ident = self._file_identity(rname, tuple(attrs), source)
+        if ident is None:
+            return None
+        with self._lock:
+            for fp, entry in self._entries.items():
+                if fp[:-1] == ident:
+                    self.stats["hits"] += 1
+                    return (fp,) + entry
+        payload = self._read(ident)
+        if payload is None or payload["fingerprint"][:-1] != ident:
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        return payload["fingerprint"], payload["proj"], payload["adj"]
+
+    def register(self, rname: str, attrs: List[str], rows, proj, adj,
+                 source: Path, persist: bool = True):
+        """
+        Adopt an index built elsewhere (e.g. during ingestion) for rows
+        loaded from source, so later relation_index calls for that file
+        are hits. The rows list is also remembered by identity, so
+        callers that don't pass the source file still find it.
+        persist=False skips writing it to disk (it was just loaded from
+        there).
+        """
+        with self._lock:
+            fp = self._fingerprint(rname, tuple(attrs), rows, source)
+            known = fp in self._entries
+        if fp is None or fp[0] != "file":
+            raise ValueError(f"{rname}: cannot register an index without its source file")
+        if persist and not known:
+            self._store(fp, proj, adj)
+        with self._lock:
+            self._remember(fp, rows, (proj, adj))
+
+    def build_indexes(self, relations, schemas: Dict[str, List[str]],
+                      sources: Optional[Dict[str, Path]] = None):
+        """
+        Same output shape as generic_join.build_indexes:
+        proj_all[(rel, attr)] and index[(rel, attr)] for every relation.
+        """
+        proj_all: Dict[Tuple[str, str], Set[int]] = {}
+        index: Dict[Tuple[str, str], Dict[int, Set[int]]] = {}
+
+        for rname, schema in schemas.items():
+            source = sources.get(rname) if sources else None
+            proj, adj = self.relation_index(rname, schema, relations[rname], source)
+            for a in schema:
+                proj_all[(rname, a)] = proj[a]
+                if a in adj:
+                    index[(rname, a)] = adj[a]
+
+        return proj_all, index
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+        if disk and self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob("*.idx.pkl"):
+                path.unlink()
+
+
+_DEFAULT_MANAGER: Optional[IndexManager] = None
+
+
+def get_index_manager() -> IndexManager:
+    """
+    The shared manager used by all engines. Persistence is enabled by
+    setting INDEX_CACHE_DIR (e.g. in .env) before the first query.
+    """
+    global _DEFAULT_MANAGER
+    if _DEFAULT_MANAGER is None:
+        _DEFAULT_MANAGER = IndexManager(os.getenv("INDEX_CACHE_DIR"))
+    return _DEFAULT_MANAGER
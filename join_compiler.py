@@ -0,0 +1,187 @@
+from typing import Dict, List, Tuple, Callable, Iterable
+
+
+# ---------------------------------------------------------------
+# QUERY COMPILATION FOR A FIXED GENERICJOIN PLAN
+#
+# generic_join.recurse / get_allowed re-derive the same plan at every
+# level of every branch: scan the schemas, find the "other" attribute,
+# look it up in the prefix dict, sort the candidate list. For a fixed
+# variable order all of that is known up front, so we generate one
+# Python function with one nested loop per variable:
+#   - every projection / adjacency map becomes a local,
+#   - candidate sets that only depend on projections are intersected
+#     once, outside the loops,
+#   - adjacency lookups read the loop variables of enclosing levels.
+# The generated function works with set-of-int indexes and with the
+# bitmap indexes from bitmap_index: variables listed in bitmap_vars are
+# iterated through their Dictionary's member memo instead of sorted(),
+# and checked with Dictionary.contains. Compiled functions are cached
+# per plan.
+# ---------------------------------------------------------------
+_CACHE: Dict[Tuple, Callable] = {}
+
+
+def _plan_key(var_order, edges, out_vars, fixed, emit, bitmap_vars):
+    return (
+        tuple(var_order),
+        tuple((rel, tuple(attrs)) for rel, attrs in edges),
+        tuple(out_vars),
+        tuple(sorted(fixed)),
+        emit,
+        tuple(sorted(bitmap_vars)),
+    )
+
+
+def generate_source(var_order: List[str],
+                    edges: List[Tuple[str, List[str]]],
+                    out_vars: List[str],
+                    fixed: Iterable[str] = (),
+                    emit: str = "tuple",
+                    bitmap_vars: Iterable[str] = ()) -> Tuple[str, List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """
+    Generate the source of a specialized join function.
+
+    Fixed variables (bound by a parent bag) are read from `constraints`
+    and only checked, never looped over; they are placed first so that
+    later levels can use them in adjacency lookups.
+
+    Candidate sets of bitmap_vars are bitmaps: they are iterated as
+    domains[var].members(c) (through its memo dict, inline) and checked
+    with domains[var].contains.
+
+    :return: (source, proj_keys, index_keys): the local P<i> / I<i>
+             are bound to proj[proj_keys[i]] / index[index_keys[i]].
+    """
+    fixed = [v for v in var_order if v in set(fixed)]
+    bitmap_vars = set(bitmap_vars)
+    order = fixed + [v for v in var_order if v not in fixed]
+    level = {v: i for i, v in enumerate(order)}
+
+    proj_keys: List[Tuple[str, str]] = []
+    index_keys: List[Tuple[str, str]] = []
+
+    def p_name(rel, var):
+        if (rel, var) not in proj_keys:
+            proj_keys.append((rel, var))
+        return f"P{proj_keys.index((rel, var))}"
+
+    def i_name(rel, var):
+        if (rel, var) not in index_keys:
+            index_keys.append((rel, var))
+        return f"I{index_keys.index((rel, var))}"
+
+    body: List[str] = []
+    hoisted: List[str] = []
+    domain_lines: List[str] = []
+    depth = 1
+
+    def emit_line(line):
+        body.append("    " * depth + line)
+
+    for i, var in enumerate(order):
+        lookups = []      # (expr) depending on enclosing loop variables
+        constants = []    # projections, independent of the prefix
+        for rel, attrs in edges:
+            if var not in attrs:
+                continue
+            others = [a for a in attrs if a != var]
+            if others and level[others[0]] < i:
+                lookups.append(f"{i_name(rel, others[0])}.get(v{level[others[0]]})")
+            else:
+                constants.append(p_name(rel, var))
+
+        if not lookups and not constants:
+            # Variable not covered by any relation: the interpreter yields nothing
+            return _empty_source(), [], []
+
+        names = []
+        if constants:
+            hoisted.append(f"    K{i} = " + " & ".join(constants))
+            names.append(f"K{i}")
+        for j, expr in enumerate(lookups):
+            emit_line(f"s{i}_{j} = {expr}")
+            emit_line(f"if s{i}_{j} is None:")
+            emit_line("    " + ("continue" if depth > 1 else "return results"))
+            names.append(f"s{i}_{j}")
+
+        if var in bitmap_vars:
+            domain_lines.append(f"    D{i} = domains[{var!r}]")
+            domain_lines.append(f"    M{i} = D{i}.memo")
+
+        if var in fixed:
+            emit_line(f"v{i} = constraints[{var!r}]")
+            if var in bitmap_vars:
+                cond = " or ".join(f"not D{i}.contains({n}, v{i})" for n in names)
+            else:
+                cond = " or ".join(f"v{i} not in {n}" for n in names)
+            emit_line(f"if {cond}:")
+            emit_line("    return results")
+            continue
+
+        if len(names) == 1:
+            emit_line(f"c{i} = {names[0]}")
+        else:
+            emit_line(f"c{i} = " + " & ".join(names))
+            emit_line(f"if not c{i}:")
+            emit_line("    continue" if depth > 1 else "    return results")
+        if var in bitmap_vars:
+            emit_line(f"m{i} = M{i}.get(c{i})")
+            emit_line(f"if m{i} is None:")
+            emit_line(f"    m{i} = D{i}.members(c{i})")
+            emit_line(f"for v{i} in m{i}:")
+        else:
+            emit_line(f"for v{i} in sorted(c{i}):")
+        depth += 1
+
+    if emit == "dict":
+        row = "{" + ", ".join(f"{v!r}: v{level[v]}" for v in out_vars) + "}"
+    else:
+        row = "(" + ", ".join(f"v{level[v]}" for v in out_vars) + ("," if len(out_vars) == 1 else "") + ")"
+    emit_line(f"append({row})")
+
+    header = ["def compiled_join(proj, index, constraints=None, append=None, domains=None):",
+              "    results = []",
+              "    if append is None:",
+              "        append = results.append"]
+    header += [f"    P{n} = proj[{k!r}]" for n, k in enumerate(proj_keys)]
+    header += [f"    I{n} = index[{k!r}]" for n, k in enumerate(index_keys)]
+    header += domain_lines
+    source = "\n".join(header + hoisted + body + ["    return results", ""])
+    return source, proj_keys, index_keys
+
+
+def _empty_source() -> str:
+    return ("def compiled_join(proj, index, constraints=None, append=None, domains=None):\n"
+            "    return []\n")
+
+
+def compile_join(var_order: List[str],
+                 edges: List[Tuple[str, List[str]]],
+                 out_vars: List[str],
+                 fixed: Iterable[str] = (),
+                 emit: str = "tuple",
+                 bitmap_vars: Iterable[str] = ()) -> Callable:
+    """
+    Return a cached function
+    f(proj, index, constraints=None, append=None, domains=None)
+    -> list of rows that evaluates the join for this plan. Rows are tuples
+    over out_vars (emit="tuple") or dicts (emit="dict"), in the same order
+    the interpretive GenericJoin produces them. If append is given (e.g. a
+    result sink's write), rows go there and the returned list stays
+    empty. For bitmap indexes, pass the variables with bitmap sets as
+    bitmap_vars and their bitmap_index.Dictionary objects as domains.
+    The generated code is kept in f.source for inspection.
+    """
+    fixed = tuple(fixed)
+    bitmap_vars = tuple(bitmap_vars)
+    key = _plan_key(var_order, edges, out_vars, fixed, emit, bitmap_vars)
+    fn = _CACHE.get(key)
+    if fn is None:
+        source, _, _ = generate_source(var_order, edges, out_vars, fixed, emit, bitmap_vars)
+        namespace: Dict[str, object] = {}
+        exec(compile(source, f"<compiled join {'/'.join(var_order)}>", "exec"), namespace)
+        fn = namespace["compiled_join"]
+        fn.source = source
+        _CACHE[key] = fn
+    return fn
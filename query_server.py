@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Iterator
+
+import generic_join
+import ghw_join
+import fhw_lazy
+from index_cache import relation_sources
+from bitmap_index import build_bitmap_indexes, build_dictionaries
+from cardinality_estimator import (
+    CardinalityEstimate, OutputTooLargeError, check_output_limit, estimate_output_size,
+)
+from result_sink import ResultSink
+
+
+# ---------------------------------------------------------------
+# LONG-LIVED QUERY SERVER
+#
+# Loads each relation directory once and keeps everything needed to
+# answer the 7-relation query hot: the raw relations, the shared
+# projection/adjacency indexes (index_cache) and the semijoin-reduced
+# GHW bag tables with their child indexes.
+#
+# Protocol: newline-delimited JSON over a Unix or TCP socket.
+#   {"op": "query", "engine": "genericjoin" | "ghw" | "fhw_lazy" | "auto",
+#    "dataset": "query_relations", "batch_size": 10000, "options": {...}}
+#       -> {"type": "batch", "rows": [[...], ...]}  (repeated)
+#       -> {"type": "done", "count": n, "elapsed": sec}
+#   {"op": "estimate", "dataset": "...", "time_budget": 0.1}
+#                                      -> {"type": "estimate", "estimate": n, ...}
+#   {"op": "load", "dataset": "..."}   -> {"type": "loaded", ...}
+#   {"op": "metrics"}                  -> {"type": "metrics", ...}
+# Errors are reported as {"type": "error", "message": "..."} and leave
+# the connection open; malformed requests are rejected up front
+# (validate_request).
+# Batches are streamed while the engine is still running: the engine
+# writes into a BatchSink on a worker thread, which hands full batches
+# to the connection through a small bounded queue (so a slow client
+# pauses the engine instead of letting the result pile up in memory).
+# A query with options {"max_output": n} is refused (as an error) when
+# the sampled output-size estimate is confidently above n rows.
+# engine "auto" picks an engine from that estimate and the data
+# (Dataset.choose_engine); the choice is reported in the "done" message.
+# ---------------------------------------------------------------
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_ESTIMATE_BUDGET = 0.1
+AUTO_ESTIMATE_BUDGET = 0.01
+# upper confidence bound on the output below which "auto" enumerates the
+# hot GHW bag tables instead of searching again with GenericJoin
+AUTO_GHW_ROWS = 1000
+LATENCY_WINDOW = 1000
+STREAM_QUEUE_BATCHES = 4
+
+ENGINES = ("genericjoin", "ghw", "fhw_lazy", "auto")
+ENCODINGS = (None, "bitmap")
+# option name -> accepted JSON types (None: may be null)
+OPTION_TYPES = {
+    "encoding": (str, None),
+    "compiled": (bool,),
+    "skew_aware": (bool,),
+    "max_output": (int, None),
+    "estimate_budget": (int, float),
+}
+
+
+def _check_type(what: str, value, types):
+    if value is None and None in types:
+        return
+    kinds = tuple(t for t in types if t is not None)
+    # bool is an int subclass, but true is no row count or time budget
+    if not isinstance(value, kinds) or (isinstance(value, bool) and bool not in kinds):
+        names = " or ".join("null" if t is None else t.__name__ for t in types)
+        raise ValueError(f"{what} must be {names}, got {json.dumps(value)}")
+
+
+def validate_request(req) -> Dict:
+    """
+    Check the shape of a decoded request and the types of its fields,
+    so that a malformed request is answered with a clear error instead
+    of failing somewhere inside an engine.
+    """
+    if not isinstance(req, dict):
+        raise ValueError("request must be a JSON object")
+    _check_type("op", req.get("op"), (str,))
+    for key in ("dataset", "engine"):
+        if key in req:
+            _check_type(key, req[key], (str,))
+    if req.get("engine", "genericjoin") not in ENGINES:
+        raise ValueError(f"Unknown engine: {req['engine']}")
+    if "batch_size" in req:
+        _check_type("batch_size", req["batch_size"], (int,))
+        if req["batch_size"] <= 0:
+            raise ValueError("batch_size must be positive")
+    if "time_budget" in req:
+        _check_type("time_budget", req["time_budget"], (int, float))
+        if req["time_budget"] <= 0:
+            raise ValueError("time_budget must be positive")
+    options = req.get("options", {})
+    _check_type("options", options, (dict,))
+    for key, value in options.items():
+        if key not in OPTION_TYPES:
+            raise ValueError(f"Unknown option: {key}")
+        _check_type(f"options.{key}", value, OPTION_TYPES[key])
+    if options.get("encoding") not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {options['encoding']}")
+    return req
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class BatchSink(ResultSink):
+    """
+    Result sink written from an engine thread and read by the event loop.
+    Every batch_size rows are put on an asyncio.Queue; the put blocks the
+    engine thread while the queue is full. None marks the end.
+    """
+
+    def __init__(self, batch_size: int, queue: asyncio.Queue,
+                 loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self.batch_size = batch_size
+        self.queue = queue
+        self.loop = loop
+        self.cancelled = False
+        self.engine: Optional[str] = None  # set by Dataset.run for engine="auto"
+        self._batch: List[Tuple[int, ...]] = []
+
+    def _put(self, item):
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def write(self, row):
+        self._batch.append(row)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            if self.cancelled:
+                raise QueryCancelled()
+            self._put(self._batch)
+            self._batch = []
+
+    def close(self):
+        if self._batch and not self.cancelled:
+            self._put(self._batch)
+        self._batch = []
+        self._put(None)
+
+
+class Dataset:
+    """One relations directory with its hot indexes and bag tables."""
+
+    def __init__(self, dirpath: str):
+        self.dirpath = dirpath
+        self.sources = relation_sources(dirpath, generic_join.SCHEMAS)
+        self._lock = threading.Lock()
+        self._ghw: Dict[bool, Tuple] = {}
+        self._fhw = None
+        self.load()
+
+    def _signature(self):
+        return tuple(
+            (p.stat().st_mtime_ns, p.stat().st_size) if p.exists() else None
+            for p in self.sources.values()
+        )
+
+    def load(self):
+        start = time.time()
+        self.signature = self._signature()
+        self.relations = generic_join.load_relations(self.dirpath)
+        # Warm the shared index manager so the first query doesn't pay for it
+        _, index = generic_join.build_indexes(self.relations, self.sources)
+        # Bitmap indexes are kept next to the set indexes, but only built
+        # if some attribute is dense enough for bitmaps (bitmap_index)
+        self.dictionaries = build_dictionaries(self.relations, generic_join.SCHEMAS)
+        self.dense = any(d.dense for d in self.dictionaries.values())
+        self.bitmap_indexes = None
+        if self.dense:
+            self.bitmap_indexes = build_bitmap_indexes(
+                self.relations, generic_join.SCHEMAS, self.dictionaries
+            )
+        # GHW keeps duplicate rows, GenericJoin does not; they only agree
+        # (and "auto" may switch between them) on duplicate-free relations
+        self.duplicate_free = all(
+            sum(map(len, index[(r, schema[0])].values())) == len(self.relations[r])
+            for r, schema in generic_join.SCHEMAS.items()
+        )
+        self._ghw.clear()
+        self._fhw = None
+        self.load_time = time.time() - start
+
+    def refresh_if_stale(self):
+        with self._lock:
+            if self._signature() != self.signature:
+                self.load()
+
+    def bitmap_state(self):
+        """(dictionaries, proj_all, index) of the bitmap encoding."""
+        with self._lock:
+            if self.bitmap_indexes is None:
+                # asked for explicitly on data without dense attributes
+                self.bitmap_indexes = build_bitmap_indexes(
+                    self.relations, generic_join.SCHEMAS, self.dictionaries
+                )
+            return self.bitmap_indexes
+
+    def ghw_state(self, skew_aware: bool):
+        with self._lock:
+            state = self._ghw.get(skew_aware)
+            if state is None:
+                bags = ghw_join.build_bags()
+                rel_tables = {
+                    r: ghw_join.relation_to_rows(r, self.relations)
+                    for r in self.relations
+                }
+                tables = ghw_join.build_bag_tables(bags, rel_tables, skew_aware)
+                ghw_join.bottom_up(bags, tables)
+                ghw_join.top_down(bags, tables)
+                child_indexes = ghw_join.build_child_indexes(bags, tables)
+                state = (bags, tables, child_indexes)
+                self._ghw[skew_aware] = state
+            return state
+
+    def fhw_state(self):
+        with self._lock:
+            if self._fhw is None:
+                bags = fhw_lazy.build_fractional_bags()
+                proj_global, index_global = fhw_lazy.build_global_indexes(
+                    self.relations, self.sources
+                )
+                self._fhw = (bags, proj_global, index_global)
+            return self._fhw
+
+    def estimate(self, time_budget: float = DEFAULT_ESTIMATE_BUDGET) -> CardinalityEstimate:
+        _, index = generic_join.build_indexes(self.relations, self.sources)
+        return estimate_output_size(self.relations, index, generic_join.SCHEMAS,
+                                    generic_join.ATTR_ORDER, time_budget=time_budget)
+
+    def choose_engine(self, est: CardinalityEstimate, options: Dict) -> Tuple[str, Dict]:
+        """
+        Engine and options for engine="auto".
+          - A (confidently) tiny output on duplicate-free relations is
+            enumerated from the hot, fully reduced GHW bag tables, in
+            time linear in the output; GenericJoin would search again.
+          - Otherwise GenericJoin with a compiled plan, on the hot bitmap
+            indexes if some attribute is dense, else on the set indexes.
+        """
+        if est.high <= AUTO_GHW_ROWS and self.duplicate_free:
+            return "ghw", dict(options, skew_aware=False)
+        options = dict(options, compiled=True)
+        options["encoding"] = "bitmap" if self.dense else None
+        return "genericjoin", options
+
+    def run(self, engine: str, options: Dict, sink: Optional[ResultSink] = None):
+        """
+        Rows of the query as a list, or written to sink (which is returned).
+        For engine="auto" the engine actually used is stored in sink.engine.
+        """
+        self.refresh_if_stale()
+        est = None
+        if options.get("max_output") is not None:
+            est = self.estimate(options.get("estimate_budget", DEFAULT_ESTIMATE_BUDGET))
+            check_output_limit(est, int(options["max_output"]))
+        if engine == "auto":
+            if est is None:
+                est = self.estimate(options.get("estimate_budget", AUTO_ESTIMATE_BUDGET))
+            engine, options = self.choose_engine(est, options)
+            if sink is not None:
+                sink.engine = engine
+                if engine == "genericjoin":
+                    sink.engine += f" ({options['encoding'] or 'sets'}, compiled)"
+        encoding = options.get("encoding")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding}")
+        compiled = bool(options.get("compiled"))
+        if engine == "genericjoin":
+            return generic_join.generic_join(
+                self.relations, self.sources, encoding, compiled=compiled, sink=sink,
+                bitmap_indexes=self.bitmap_state() if encoding == "bitmap" else None
+            )
+        if engine == "ghw":
+            bags, tables, child_indexes = self.ghw_state(bool(options.get("skew_aware")))
+            return ghw_join.enumerate_results(bags, tables, child_indexes, sink=sink)
+        if engine == "fhw_lazy":
+            bags, proj_global, index_global = self.fhw_state()
+            dictionaries = None
+            if encoding == "bitmap":
+                dictionaries, proj_global, index_global = self.bitmap_state()
+            return fhw_lazy.enumerate_fhw(bags, proj_global, index_global, root="B1",
+                                          dictionaries=dictionaries, compiled=compiled,
+                                          sink=sink)
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.in_flight = 0
+        self.served = 0
+        self.errors = 0
+        self.latencies: Dict[str, deque] = {}
+
+    def record(self, engine: str, elapsed: float):
+        self.served += 1
+        self.latencies.setdefault(engine, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+
+    def snapshot(self, datasets: Dict[str, Dataset]) -> Dict:
+        engines = {}
+        for engine, window in self.latencies.items():
+            lat = sorted(window)
+            engines[engine] = {
+                "count": len(lat),
+                "mean": sum(lat) / len(lat),
+                "p50": lat[len(lat) // 2],
+                "p95": lat[min(len(lat) - 1, int(len(lat) * 0.95))],
+                "max": lat[-1],
+            }
+        return {
+            "uptime": time.time() - self.started,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "errors": self.errors,
+            "latency": engines,
+            "datasets": {
+                name: {"load_time": ds.load_time,
+                       "rows": {r: len(rows) for r, rows in ds.relations.items()}}
+                for name, ds in datasets.items()
+            },
+        }
+
+
+class QueryServer:
+    def __init__(self):
+        self.datasets: Dict[str, Dataset] = {}
+        self.metrics = Metrics()
+        self._load_lock = asyncio.Lock()
+
+    async def dataset(self, dirpath: str) -> Dataset:
+        async with self._load_lock:
+            ds = self.datasets.get(dirpath)
+            if ds is None:
+                loop = asyncio.get_running_loop()
+                ds = await loop.run_in_executor(None, Dataset, dirpath)
+                self.datasets[dirpath] = ds
+            return ds
+
+    async def _send(self, writer: asyncio.StreamWriter, msg: Dict):
+        writer.write(json.dumps(msg).encode() + b"\n")
+        await writer.drain()
+
+    async def _query(self, req: Dict, writer: asyncio.StreamWriter):
+        engine = req.get("engine", "genericjoin")
+        batch_size = req.get("batch_size", DEFAULT_BATCH_SIZE)
+        ds = await self.dataset(req.get("dataset", "query_relations"))
+
+        start = time.time()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_BATCHES)
+        sink = BatchSink(batch_size, queue, loop)
+
+        def produce():
+            try:
+                ds.run(engine, req.get("options", {}), sink)
+            finally:
+                sink.close()
+
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                await self._send(writer, {"type": "batch", "rows": batch})
+        except BaseException:
+            # client gone: stop the engine at its next batch and let it finish
+            sink.cancelled = True
+            while await queue.get() is not None:
+                pass
+            try:
+                await producer
+            except QueryCancelled:
+                pass
+            raise
+
+        await producer
+        elapsed = time.time() - start
+        self.metrics.record(engine, elapsed)
+        done = {"type": "done", "count": sink.count, "elapsed": elapsed}
+        if sink.engine:
+            done["engine"] = sink.engine
+        await self._send(writer, done)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.metrics.in_flight += 1
+                try:
+                    req = validate_request(json.loads(line))
+                    op = req["op"]
+                    if op == "query":
+                        await self._query(req, writer)
+                    elif op == "estimate":
+                        ds = await self.dataset(req.get("dataset", "query_relations"))
+                        loop = asyncio.get_running_loop()
+                        est = await loop.run_in_executor(
+                            None, ds.estimate,
+                            req.get("time_budget", DEFAULT_ESTIMATE_BUDGET))
+                        await self._send(writer, {"type": "estimate", **est.__dict__})
+                    elif op == "load":
+                        ds = await self.dataset(req["dataset"])
+                        await self._send(writer, {"type": "loaded", "dataset": ds.dirpath,
+                                                  "load_time": ds.load_time})
+                    elif op == "metrics":
+                        await self._send(writer, {"type": "metrics",
+                                                  **self.metrics.snapshot(self.datasets)})
+                    else:
+                        raise ValueError(f"Unknown op: {op}")
+                except (ValueError, KeyError, OSError, OutputTooLargeError) as e:
+                    self.metrics.errors += 1
+                    await self._send(writer, {"type": "error", "message": str(e)})
+                except Exception as e:
+                    # a bug, not a bad request: report it and keep serving
+                    self.metrics.errors += 1
+                    await self._send(writer, {"type": "error",
+                                              "message": f"{type(e).__name__}: {e}"})
+                finally:
+                    self.metrics.in_flight -= 1
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str, preload: Optional[List[str]] = None):
+        for dirpath in preload or []:
+            await self.dataset(dirpath)
+
+        kind, target = parse_address(address)
+        if kind == "unix":
+            Path(target).unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(self.handle, path=target)
+        else:
+            host, port = target
+            server = await asyncio.start_server(self.handle, host, port)
+
+        print(f"Query server listening on {address}")
+        async with server:
+            await server.serve_forever()
+
+
+def parse_address(address: str):
+    """'unix:/path/to.sock' or 'host:port'."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+# ---------------------------------------------------------------
+# CLIENT
+# ---------------------------------------------------------------
+class QueryClient:
+    """
+    Blocking client for the query server.
+
+        with QueryClient("unix:/tmp/cs580.sock") as client:
+            for row in client.query("ghw", "query_relations"):
+                ...
+    """
+
+    def __init__(self, address: str):
+        kind, target = parse_address(address)
+        if kind == "unix":
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect(target)
+        self.file = self.sock.makefile("rwb")
+        self.last_elapsed: Optional[float] = None
+        self.last_engine: Optional[str] = None
+
+    def _request(self, req: Dict):
+        self.file.write(json.dumps(req).encode() + b"\n")
+        self.file.flush()
+
+    def _response(self) -> Dict:
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Query server closed the connection")
+        msg = json.loads(line)
+        if msg["type"] == "error":
+            raise RuntimeError(msg["message"])
+        return msg
+
+    def query_batches(self, engine: str = "genericjoin", dataset: str = "query_relations",
+                      batch_size: int = DEFAULT_BATCH_SIZE, **options) -> Iterator[List[Tuple[int, ...]]]:
+        self._request({"op": "query", "engine": engine, "dataset": dataset,
+                       "batch_size": batch_size, "options": options})
+        while True:
+            msg = self._response()
+            if msg["type"] == "done":
+                self.last_elapsed = msg["elapsed"]
+                self.last_engine = msg.get("engine")
+                return
+            yield [tuple(r) for r in msg["rows"]]
+
+    def query(self, engine: str = "genericjoin", dataset: str = "query_relations",
+              **options) -> Iterator[Tuple[int, ...]]:
+        for batch in self.query_batches(engine, dataset, **options):
+            yield from batch
+
+    def estimate(self, dataset: str = "query_relations",
+                 time_budget: float = DEFAULT_ESTIMATE_BUDGET) -> Dict:
+        self._request({"op": "estimate", "dataset": dataset, "time_budget": time_budget})
+        return self._response()
+
+    def load(self, dataset: str) -> Dict:
+        self._request({"op": "load", "dataset": dataset})
+        return self._response()
+
+    def metrics(self) -> Dict:
+        self._request({"op": "metrics"})
+        return self._response()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve join queries from hot indexes.")
+    parser.add_argument("--address", default="unix:/tmp/cs580_query.sock",
+                        help="unix:/path/to.sock or host:port")
+    parser.add_argument("--preload", nargs="*", default=["query_relations"],
+                        help="relation directories to load at startup")
+    args = parser.parse_args()
+    asyncio.run(QueryServer().serve(args.address, args.preload))
@@ -0,0 +1,193 @@
+import csv
+import sys
+from array import array
+from typing import List, Tuple, Iterable, Iterator, Optional, Sequence
+
+
+# ---------------------------------------------------------------
+# RESULT SINKS
+#
+# Engines normally return List[Tuple[int, ...]]: a million 6-attribute
+# rows is ~1M tuple objects + 6M int objects. A sink receives rows one
+# at a time (sink.write(row)) and decides how to keep them:
+#   ColumnarBuffer  - in memory, one int64 array per column, in chunks
+#   BinaryFileSink  - packed int64 rows, flushed in large blocks
+#   CSVSink         - CSV text, flushed in large blocks
+#   CountingSink    - keeps nothing, only counts
+# Every sink supports len() so timing code can report the output size.
+# ---------------------------------------------------------------
+CHUNK_ROWS = 65536
+BINARY_MAGIC = b"CS580RS1"
+INT64 = "q"
+
+
+class ResultSink:
+    def __init__(self):
+        self.count = 0
+
+    def write(self, row: Sequence[int]):
+        raise NotImplementedError
+
+    def write_many(self, rows: Iterable[Sequence[int]]):
+        write = self.write
+        for row in rows:
+            write(row)
+
+    def close(self):
+        pass
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CountingSink(ResultSink):
+    def write(self, row: Sequence[int]):
+        self.count += 1
+
+    def write_many(self, rows: Iterable[Sequence[int]]):
+        self.count += sum(1 for _ in rows)
+
+
+class ColumnarBuffer(ResultSink):
+    """
+    Rows stored column-wise in typed int64 arrays. Each column is a list
+    of chunks of CHUNK_ROWS values, so growing never copies what is
+    already stored (8 bytes per value instead of a boxed int).
+    """
+
+    def __init__(self, width: int, chunk_rows: int = CHUNK_ROWS):
+        super().__init__()
+        self.width = width
+        self.chunk_rows = chunk_rows
+        self.chunks: List[List[array]] = []
+        self._current: Optional[List[array]] = None
+        self._appenders = []
+
+    def _new_chunk(self):
+        self._current = [array(INT64) for _ in range(self.width)]
+        self.chunks.append(self._current)
+        self._appenders = [col.append for col in self._current]
+
+    def write(self, row: Sequence[int]):
+        if self.count % self.chunk_rows == 0:
+            self._new_chunk()
+        for append, v in zip(self._appenders, row):
+            append(v)
+        self.count += 1
+
+    def column(self, i: int) -> array:
+        """Column i as a single array (copies the chunks once)."""
+        out = array(INT64)
+        for chunk in self.chunks:
+            out.extend(chunk[i])
+        return out
+
+    def __iter__(self) -> Iterator[Tuple[int, ...]]:
+        for chunk in self.chunks:
+            yield from zip(*chunk)
+
+    def to_list(self) -> List[Tuple[int, ...]]:
+        return list(self)
+
+    def nbytes(self) -> int:
+        return sum(col.itemsize * len(col) for chunk in self.chunks for col in chunk)
+
+
+class BinaryFileSink(ResultSink):
+    """
+    Packed native-endian int64 rows: header = BINARY_MAGIC + width
+    (int64), then width values per row.
+    Rows are buffered in an array and written with one call per block.
+    """
+
+    def __init__(self, path: str, width: int, block_rows: int = CHUNK_ROWS):
+        super().__init__()
+        self.width = width
+        self.block_values = block_rows * width
+        self.f = open(path, "wb")
+        self.f.write(BINARY_MAGIC)
+        array(INT64, [width]).tofile(self.f)
+        self.buf = array(INT64)
+
+    def write(self, row: Sequence[int]):
+        self.buf.extend(row)
+        self.count += 1
+        if len(self.buf) >= self.block_values:
+            self.flush()
+
+    def flush(self):
+        self.buf.tofile(self.f)
+        self.buf = array(INT64)
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+def read_binary_results(path: str, block_rows: int = CHUNK_ROWS) -> Iterator[Tuple[int, ...]]:
+    """Read back a file written by BinaryFileSink."""
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"Not a binary result file: {path}")
+        header = array(INT64)
+        header.fromfile(f, 1)
+        width = header[0]
+        while True:
+            block = array(INT64)
+            try:
+                block.fromfile(f, block_rows * width)
+            except EOFError:
+                pass  # short last block: fromfile keeps what it read
+            if not block:
+                return
+            for i in range(0, len(block), width):
+                yield tuple(block[i:i + width])
+
+
+class CSVSink(ResultSink):
+    """
+    CSV output with an optional header. Rows are collected and handed to
+    csv.writer.writerows in blocks, through a large write buffer.
+    path=None writes to stdout.
+    """
+
+    def __init__(self, path: Optional[str] = None, header: Optional[List[str]] = None,
+                 block_rows: int = CHUNK_ROWS):
+        super().__init__()
+        if path is None:
+            self.f = sys.stdout
+            self._owns = False
+        else:
+            self.f = open(path, "w", newline="", buffering=1 << 20)
+            self._owns = True
+        self.writer = csv.writer(self.f)
+        if header:
+            self.writer.writerow(header)
+        self.block_rows = block_rows
+        self.pending: List[Sequence[int]] = []
+
+    def write(self, row: Sequence[int]):
+        self.pending.append(row)
+        self.count += 1
+        if len(self.pending) >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.pending)
+        self.pending = []
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        if self._owns:
+            self.f.close()
+        else:
+            self.f.flush()
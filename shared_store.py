@@ -0,0 +1,387 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from multiprocessing import Pool, parent_process, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from statistics import NormalDist
+from typing import Dict, List, Tuple, Optional, Callable, Any
+import math
+import os
+import sys
+
+from index_cache import build_relation_index
+from cardinality_estimator import CardinalityEstimate, estimate_output_size
+from join_compiler import compile_join
+from result_sink import BinaryFileSink, CountingSink
+
+
+# ---------------------------------------------------------------
+# SHARED-MEMORY RELATION / INDEX STORE
+#
+# One SharedMemory segment holds, for every binary relation R(a, b):
+#   - the two columns (int64),
+#   - per attribute a CSR index: sorted distinct keys (= projection),
+#     offsets (len(keys) + 1) and the concatenated sorted neighbour
+#     values of the other attribute.
+# The layout (segment name + byte offsets) is a small picklable
+# StoreHandle; worker processes attach to the segment with it and read
+# the arrays through read-only memoryviews, so the relations and CSR
+# arrays are neither pickled nor copied per worker.
+#
+# The engines are not zero-copy on top of that: they need `&` on
+# candidate sets, so each process that joins builds
+#   - one frozenset per (relation, attribute) projection, once per
+#     attached store (O(distinct keys) per process), and
+#   - a frozenset per neighbour list it looks up, copied from its CSR
+#     slice; the first NEIGHBOUR_CACHE of them per map are kept (a join
+#     probes the same keys over and over), the rest are rebuilt.
+# The estimator copies the distinct rows of its start relation and the
+# neighbour lists it samples. Nothing handed out references the
+# segment except the store's own cached views, so release() always
+# succeeds.
+#
+# Lifecycle:
+#   store = SharedStore.create(relations, SCHEMAS)   # owner process
+#   view = SharedStore.attach(store.handle)          # any process
+#   view.release()                                   # every attacher
+#   store.destroy()                                  # owner, once, last
+# Consumers: parallel_generic_join (a compiled GenericJoin per worker,
+# each on a share of the first variable, writing its rows to its own
+# result file) and parallel_estimate. Both are batch entry points for
+# one process pool; the query server keeps its own in-process indexes
+# (index_cache) and does not use the store.
+# ---------------------------------------------------------------
+INT64 = "q"
+ITEM_SIZE = array(INT64).itemsize
+PART_REL = "_part"  # unary relation restricting the first variable per worker
+NEIGHBOUR_CACHE = 1 << 14  # neighbour sets kept per CSRMap (per process)
+
+# segments created by this process (their tracker entry belongs to the owner)
+_CREATED = set()
+
+
+@dataclass
+class StoreHandle:
+    shm_name: str
+    schemas: Dict[str, List[str]]
+    # (rel, part) -> (byte offset, length); part is "col:<attr>",
+    # "keys:<attr>", "offsets:<attr>" or "values:<attr>"
+    layout: Dict[Tuple[str, str], Tuple[int, int]] = field(default_factory=dict)
+
+
+class CSRMap:
+    """
+    Read-only adjacency map over CSR arrays, with the part of the dict
+    API the engines and the estimator use: get / [] / in / len.
+    Neighbour lists are returned as frozensets copied out of the shared
+    values array, so they stay valid after the store is released.
+    """
+
+    def __init__(self, keys: memoryview, offsets: memoryview, values: memoryview):
+        self.keys, self.offsets, self.values = keys, offsets, values
+        self._sets: Dict[int, frozenset] = {}
+
+    def _pos(self, key: int) -> int:
+        i = bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+    def get(self, key: int, default=None):
+        found = self._sets.get(key)
+        if found is not None:
+            return found
+        i = self._pos(key)
+        if i < 0:
+            return default
+        with self.values[self.offsets[i]:self.offsets[i + 1]] as neighbours:
+            found = frozenset(neighbours)
+        if len(self._sets) < NEIGHBOUR_CACHE:
+            self._sets[key] = found
+        return found
+
+    def __getitem__(self, key: int):
+        res = self.get(key)
+        if res is None:
+            raise KeyError(key)
+        return res
+
+    def __contains__(self, key: int) -> bool:
+        return self._pos(key) >= 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class RowsView:
+    """Sequence of (a, b) tuples read from two shared int64 columns."""
+
+    def __init__(self, col_a: memoryview, col_b: memoryview):
+        self.col_a, self.col_b = col_a, col_b
+
+    def __len__(self) -> int:
+        return len(self.col_a)
+
+    def __getitem__(self, i: int) -> Tuple[int, int]:
+        return self.col_a[i], self.col_b[i]
+
+    def __iter__(self):
+        return zip(self.col_a, self.col_b)
+
+
+class SharedStore:
+    def __init__(self, shm: SharedMemory, handle: StoreHandle, owner: bool):
+        self.shm = shm
+        self.handle = handle
+        self.owner = owner
+        self._base = shm.buf.toreadonly().cast("B")
+        self._views: List[memoryview] = [self._base]
+        # (rel, part) -> array view, and the dicts built from them, so
+        # repeated accessor calls reuse the same views
+        self._arrays: Dict[Tuple[str, str], memoryview] = {}
+        self._relations: Optional[Dict[str, "RowsView"]] = None
+        self._indexes: Optional[Dict[Tuple[str, str], CSRMap]] = None
+        self._projections: Optional[Dict[Tuple[str, str], frozenset]] = None
+
+    # -----------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------
+    @classmethod
+    def create(cls, relations: Dict[str, List[Tuple[int, ...]]],
+               schemas: Dict[str, List[str]]) -> "SharedStore":
+        """Build the CSR arrays and copy them into a new segment (owner)."""
+        parts: List[Tuple[Tuple[str, str], array]] = []
+        for rel, schema in schemas.items():
+            rows = relations[rel]
+            for i, attr in enumerate(schema):
+                parts.append(((rel, f"col:{attr}"), array(INT64, (t[i] for t in rows))))
+
+            _, adj = build_relation_index(schema, rows)
+            for attr in schema:
+                keys = sorted(adj[attr])
+                offsets = array(INT64, [0])
+                values = array(INT64)
+                for k in keys:
+                    values.extend(sorted(adj[attr][k]))
+                    offsets.append(len(values))
+                parts.append(((rel, f"keys:{attr}"), array(INT64, keys)))
+                parts.append(((rel, f"offsets:{attr}"), offsets))
+                parts.append(((rel, f"values:{attr}"), values))
+
+        total = sum(len(arr) for _, arr in parts) * ITEM_SIZE
+        shm = SharedMemory(create=True, size=max(total, 1))
+        _CREATED.add(shm.name)
+        handle = StoreHandle(shm.name, {r: list(s) for r, s in schemas.items()})
+        offset = 0
+        for key, arr in parts:
+            nbytes = len(arr) * ITEM_SIZE
+            shm.buf[offset:offset + nbytes] = arr.tobytes()
+            handle.layout[key] = (offset, len(arr))
+            offset += nbytes
+        return cls(shm, handle, owner=True)
+
+    @classmethod
+    def attach(cls, handle: StoreHandle) -> "SharedStore":
+        """Map an existing segment read-only, without copying."""
+        # The owner is responsible for unlinking. Processes started by
+        # multiprocessing share the owner's resource tracker, but an
+        # unrelated process has its own, which would remove the segment
+        # when that process exits; opt out of tracking there.
+        untrack = handle.shm_name not in _CREATED and parent_process() is None
+        if untrack and sys.version_info >= (3, 13):
+            shm = SharedMemory(name=handle.shm_name, track=False)
+        else:
+            shm = SharedMemory(name=handle.shm_name)
+            if untrack:
+                # before 3.13 the only way out is to unregister the name
+                # SharedMemory registered (shm._name, with its leading "/")
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, handle, owner=False)
+
+    def release(self):
+        """
+        Drop this process's mapping. RowsView and CSRMap objects from this
+        store must not be used afterwards; neighbour sets and projections
+        are copies and remain valid.
+        """
+        self._arrays.clear()
+        self._relations = self._indexes = None
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self.shm.close()
+
+    def destroy(self):
+        """Owner only: release and remove the segment from the system."""
+        if not self.owner:
+            raise RuntimeError("Only the creating process may destroy the store")
+        self.release()
+        self.shm.unlink()
+        _CREATED.discard(self.shm.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.owner:
+            self.destroy()
+        else:
+            self.release()
+
+    # -----------------------------------------------------------
+    # Read access
+    # -----------------------------------------------------------
+    def _array(self, rel: str, part: str) -> memoryview:
+        view = self._arrays.get((rel, part))
+        if view is None:
+            offset, length = self.handle.layout[(rel, part)]
+            view = self._base[offset:offset + length * ITEM_SIZE].cast(INT64)
+            self._views.append(view)
+            self._arrays[(rel, part)] = view
+        return view
+
+    def rows(self, rel: str) -> RowsView:
+        a, b = self.handle.schemas[rel]
+        return RowsView(self._array(rel, f"col:{a}"), self._array(rel, f"col:{b}"))
+
+    def projection(self, rel: str, attr: str) -> frozenset:
+        """Distinct values of attr in rel."""
+        return self.projections()[(rel, attr)]
+
+    def adjacency(self, rel: str, attr: str) -> CSRMap:
+        return CSRMap(self._array(rel, f"keys:{attr}"),
+                      self._array(rel, f"offsets:{attr}"),
+                      self._array(rel, f"values:{attr}"))
+
+    def relations(self) -> Dict[str, RowsView]:
+        if self._relations is None:
+            self._relations = {rel: self.rows(rel) for rel in self.handle.schemas}
+        return self._relations
+
+    def indexes(self) -> Dict[Tuple[str, str], CSRMap]:
+        """Same keys as generic_join.build_indexes' index, over the CSR arrays."""
+        if self._indexes is None:
+            self._indexes = {(rel, a): self.adjacency(rel, a)
+                             for rel, schema in self.handle.schemas.items() for a in schema}
+        return self._indexes
+
+    def projections(self) -> Dict[Tuple[str, str], frozenset]:
+        """Same keys as generic_join.build_indexes' proj_all (built once)."""
+        if self._projections is None:
+            self._projections = {
+                (rel, a): frozenset(self._array(rel, f"keys:{a}"))
+                for rel, schema in self.handle.schemas.items() for a in schema
+            }
+        return self._projections
+
+
+# ---------------------------------------------------------------
+# Worker pools attached to one store
+# ---------------------------------------------------------------
+_WORKER_STORE: Optional[SharedStore] = None
+
+
+def _init_worker(handle: StoreHandle):
+    global _WORKER_STORE
+    _WORKER_STORE = SharedStore.attach(handle)
+
+
+def _call_in_worker(job):
+    fn, arg = job
+    return fn(_WORKER_STORE, arg)
+
+
+def run_in_workers(store: SharedStore, fn: Callable[[SharedStore, Any], Any],
+                   args: List[Any], processes: Optional[int] = None) -> List[Any]:
+    """
+    Run fn(attached_store, arg) for every arg in a process pool whose
+    workers attach to `store` once at start-up. fn must be a module-level
+    function (it is pickled by reference).
+    """
+    with Pool(processes, initializer=_init_worker, initargs=(store.handle,)) as pool:
+        return pool.map(_call_in_worker, [(fn, a) for a in args])
+
+
+def store_generic_join(store: SharedStore, attr_order: List[str],
+                       first_values: Optional[frozenset] = None, sink=None):
+    """
+    GenericJoin (compiled plan, join_compiler) over the store's indexes.
+    first_values restricts the first variable of attr_order, which is
+    how parallel_generic_join splits the work.
+    """
+    edges = list(store.handle.schemas.items())
+    proj_all = store.projections()
+    if first_values is not None:
+        proj_all = dict(proj_all)
+        proj_all[(PART_REL, attr_order[0])] = first_values
+        edges = [(PART_REL, [attr_order[0]])] + edges
+    run = compile_join(attr_order, edges, attr_order)
+    results = run(proj_all, store.indexes(), append=sink.write if sink is not None else None)
+    return sink if sink is not None else results
+
+
+def _join_job(store: SharedStore, job) -> int:
+    attr_order, values, path = job
+    if path is None:
+        sink = CountingSink()
+    else:
+        sink = BinaryFileSink(path, len(attr_order))
+    with sink:
+        store_generic_join(store, attr_order, frozenset(values), sink)
+    return sink.count
+
+
+def parallel_generic_join(store: SharedStore, attr_order: List[str], processes: int = 4,
+                          out_dir: Optional[str] = None) -> Tuple[int, List[str]]:
+    """
+    GenericJoin in `processes` workers over the shared store, each one
+    taking a share of the values of the first variable.
+
+    Rows are not sent back to this process (pickling them costs more
+    than the join saves): with out_dir every worker writes its rows to
+    out_dir/part-<i>.bin (BinaryFileSink, read back with
+    result_sink.read_binary_results), otherwise the workers only count.
+    Returns the total row count and the result files; together the files
+    hold the same multiset as the single-process run.
+    """
+    first = attr_order[0]
+    values = sorted(frozenset.intersection(*(
+        proj for (rel, attr), proj in store.projections().items() if attr == first
+    )))
+    shares = [values[i::processes] for i in range(processes)]
+    paths: List[Optional[str]] = [None] * processes
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        paths = [os.path.join(out_dir, f"part-{i}.bin") for i in range(processes)]
+    counts = run_in_workers(store, _join_job,
+                            [(attr_order, s, p) for s, p in zip(shares, paths)], processes)
+    return sum(counts), [p for p in paths if p is not None]
+
+
+def _estimate_job(store: SharedStore, job) -> CardinalityEstimate:
+    attr_order, time_budget, seed = job
+    return estimate_output_size(store.relations(), store.indexes(), store.handle.schemas,
+                                attr_order, time_budget=time_budget, seed=seed)
+
+
+def parallel_estimate(store: SharedStore, attr_order: List[str], processes: int = 4,
+                      time_budget: float = 0.5) -> CardinalityEstimate:
+    """Wander join in `processes` workers over the shared store, combined."""
+    parts = run_in_workers(store, _estimate_job,
+                           [(attr_order, time_budget, seed) for seed in range(processes)],
+                           processes)
+    walks = sum(p.walks for p in parts)
+    if walks == 0:
+        return CardinalityEstimate(0.0, 0.0, 0.0, 0, 0, 0.0)
+
+    z = NormalDist().inv_cdf(0.5 + parts[0].confidence / 2)
+    mean = sum(p.estimate * p.walks for p in parts) / walks
+    # each part's standard error is its CI half-width / z; weights n_i / N
+    se = math.sqrt(sum((p.walks / walks * (p.high - p.estimate) / z) ** 2 for p in parts))
+    return CardinalityEstimate(
+        estimate=mean,
+        low=max(0.0, mean - z * se),
+        high=mean + z * se,
+        walks=walks,
+        successes=sum(p.successes for p in parts),
+        elapsed=max(p.elapsed for p in parts),
+        confidence=parts[0].confidence,
+    )
@@ -0,0 +1,155 @@
+import math
+from typing import Dict, List, Tuple, Optional
+from generic_join import generic_join_subquery
+
+
+# ---------------------------------------------------------------
+# HEAVY/LIGHT EVALUATION OF A CYCLIC (TRIANGLE) SUBQUERY
+#
+# Joining R1(A1,A2) ⋈ R2(A2,A3) before R3(A1,A3) is applied can produce
+# deg_R1(b) * deg_R2(b) rows for every A2 value b, i.e. a quadratic
+# intermediate when b is a heavy hitter. We split the values of the
+# join attribute by degree:
+#   - light values (degree <= threshold on both sides): hash join the
+#     two relations and probe the closing relation right away. Every
+#     light value adds at most threshold * deg rows, so this part is
+#     O(N * threshold).
+#   - heavy values: there are at most 2N / threshold of them; they are
+#     evaluated with GenericJoin (join attribute first), which is
+#     worst-case optimal.
+# With threshold = sqrt(N) both parts stay within the AGM bound N^1.5.
+# The closing relation only filters: like a plain bag table, the result
+# keeps the multiplicities of left ⋈ right (the heavy part's distinct
+# GenericJoin rows are repeated mult_left * mult_right times).
+# ---------------------------------------------------------------
+def degree_threshold(sizes: List[int]) -> int:
+    return max(1, int(math.sqrt(max(sizes, default=1))))
+
+
+def find_triangle(edges: List[Tuple[str, List[str]]]):
+    """
+    Given binary edges over three variables, return
+    (left, right, closing, join_var) where left and right share join_var
+    and closing covers the two remaining variables; None if the edges
+    do not form a triangle. left and right are the first such pair in
+    the order of edges.
+    """
+    binary = [(rel, attrs) for rel, attrs in edges if len(attrs) == 2]
+    variables = {a for _, attrs in binary for a in attrs}
+    if len(variables) != 3:
+        return None
+
+    for i, (r1, a1) in enumerate(binary):
+        for r2, a2 in binary[i + 1:]:
+            shared = set(a1) & set(a2)
+            if len(shared) != 1:
+                continue
+            join_var = shared.pop()
+            rest = set(variables) - {join_var}
+            for r3, a3 in binary:
+                if r3 not in (r1, r2) and set(a3) == rest:
+                    return (r1, a1), (r2, a2), (r3, a3), join_var
+    return None
+
+
+def heavy_light_triangle(out_vars: List[str],
+                         edges: List[Tuple[str, List[str]]],
+                         relations: Dict[str, List[Dict[str, int]]],
+                         threshold: Optional[int] = None,
+                         stats: Optional[Dict[str, int]] = None) -> List[Dict[str, int]]:
+    """
+    Evaluate the triangle formed by `edges` with heavy/light partitioning
+    and return its rows projected to out_vars, with the multiplicities
+    of left ⋈ right (ghw_join.build_bag_table's multiset, filtered by the
+    closing relation).
+
+    :param edges: (rel_name, [attr, attr]) pairs forming a triangle
+    :param relations: rel_name -> list of dict rows (as in ghw_join)
+    :param threshold: degree above which a join value is heavy;
+                      defaults to sqrt of the largest relation
+    :param stats: optional dict filled with threshold / heavy / light counts
+    """
+    tri = find_triangle(edges)
+    if tri is None:
+        raise ValueError("edges do not form a triangle")
+    (left, left_attrs), (right, right_attrs), (closing, closing_attrs), jv = tri
+    x = next(a for a in left_attrs if a != jv)
+    y = next(a for a in right_attrs if a != jv)
+
+    left_rows, right_rows = relations[left], relations[right]
+    if threshold is None:
+        threshold = degree_threshold(
+            [len(left_rows), len(right_rows), len(relations[closing])]
+        )
+
+    # Degrees of the join attribute on both sides
+    deg_left: Dict[int, int] = {}
+    for row in left_rows:
+        deg_left[row[jv]] = deg_left.get(row[jv], 0) + 1
+    deg_right: Dict[int, int] = {}
+    for row in right_rows:
+        deg_right[row[jv]] = deg_right.get(row[jv], 0) + 1
+
+    heavy = {
+        v for v in deg_left.keys() & deg_right.keys()
+        if deg_left[v] > threshold or deg_right[v] > threshold
+    }
+
+    out: List[Dict[str, int]] = []
+
+    # Light part: hash join on the join attribute, probe the closing relation
+    closing_keys = {(row[x], row[y]) for row in relations[closing]}
+    right_by_key: Dict[int, List[int]] = {}
+    for row in right_rows:
+        v = row[jv]
+        if v not in heavy:
+            right_by_key.setdefault(v, []).append(row[y])
+
+    light_rows = 0
+    for row in left_rows:
+        v = row[jv]
+        ys = right_by_key.get(v)
+        if not ys:
+            continue
+        xv = row[x]
+        for yv in ys:
+            if (xv, yv) in closing_keys:
+                assign = {jv: v, x: xv, y: yv}
+                out.append({a: assign[a] for a in out_vars})
+                light_rows += 1
+
+    # Heavy part: worst-case optimal join over the few heavy values
+    heavy_rows = 0
+    if heavy:
+        restricted = {
+            left: [row for row in left_rows if row[jv] in heavy],
+            right: [row for row in right_rows if row[jv] in heavy],
+            closing: relations[closing],
+        }
+        # GenericJoin works on sets: count the duplicates it collapses
+        mult_left: Dict[Tuple[int, int], int] = {}
+        for row in restricted[left]:
+            key = (row[jv], row[x])
+            mult_left[key] = mult_left.get(key, 0) + 1
+        mult_right: Dict[Tuple[int, int], int] = {}
+        for row in restricted[right]:
+            key = (row[jv], row[y])
+            mult_right[key] = mult_right.get(key, 0) + 1
+
+        tri_edges = [(left, left_attrs), (right, right_attrs), (closing, closing_attrs)]
+        for assign in generic_join_subquery([jv, x, y], tri_edges, restricted):
+            v = assign[jv]
+            n = mult_left[(v, assign[x])] * mult_right[(v, assign[y])]
+            row = {a: assign[a] for a in out_vars}
+            out.extend(dict(row) for _ in range(n))
+            heavy_rows += n
+
+    if stats is not None:
+        stats.update({
+            "threshold": threshold,
+            "heavy_values": len(heavy),
+            "light_rows": light_rows,
+            "heavy_rows": heavy_rows,
+        })
+
+    return out
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import struct
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, List, Tuple, Callable, Union
+
+
+# ---------------------------------------------------------------
+# MULTISET RESULT VERIFICATION
+#
+# Engines return rows as tuples (GenericJoin, GHW, FHW), lists
+# (problem2 / problem3) or MySQL tuples, in arbitrary order. Two result
+# streams are compared as multisets:
+#   1. one streaming pass per side computing an order-independent
+#      fingerprint (row count + two sums of per-row hashes mod 2^64);
+#      linear time, O(1) memory. The per-row hash is a 128-bit BLAKE2b
+#      of the row's int64 encoding, split in two 64-bit halves (Python's
+#      hash() collides on purpose, e.g. hash(-1) == hash(-2));
+#   2. only if the fingerprints differ, a bucketed diff that reports
+#      the first differing rows with their multiplicities. Both sides are
+#      partitioned by row hash into temporary files of about
+#      DIFF_BUCKET_ROWS rows, and each pair of buckets is compared with
+#      Counters, so memory stays bounded however large the results are.
+# ---------------------------------------------------------------
+MASK64 = (1 << 64) - 1
+DIFF_BUCKET_ROWS = 1 << 20  # rows per side held in memory by the diff
+SPILL_ROWS = 4096           # rows buffered per bucket before writing
+
+# Zero-arg callables are accepted so the diff can re-read a stream
+# (e.g. lambda: load_printed_results(path)) without keeping it in memory.
+Source = Union[Iterable, Callable[[], Iterable]]
+
+
+@dataclass
+class MultisetDigest:
+    count: int = 0
+    sum1: int = 0
+    sum2: int = 0
+
+    def add(self, row: Tuple[int, ...]):
+        h1, h2 = row_hash(row)
+        self.count += 1
+        self.sum1 = (self.sum1 + h1) & MASK64
+        self.sum2 = (self.sum2 + h2) & MASK64
+
+
+_PACKERS = {}  # row width w -> Struct packing (w, *row) as int64s
+_PAIR = struct.Struct("<QQ")
+
+
+def row_hash(row: Tuple[int, ...]) -> Tuple[int, int]:
+    """Two independent 64-bit hashes of a canonical encoding of row."""
+    packer = _PACKERS.get(len(row))
+    if packer is None:
+        packer = _PACKERS[len(row)] = struct.Struct(f"<{len(row) + 1}q")
+    try:
+        data = packer.pack(len(row), *row)
+    except struct.error:
+        # values outside int64 (the tag can't be a valid packed width)
+        data = b"r" + repr(row).encode()
+    return _PAIR.unpack(hashlib.blake2b(data, digest_size=16).digest())
+
+
+@dataclass
+class VerificationResult:
+    equal: bool
+    count_a: int
+    count_b: int
+    # (row, multiplicity in a, multiplicity in b) for the first differing rows
+    differences: List[Tuple[Tuple[int, ...], int, int]] = field(default_factory=list)
+
+    def report(self, name_a: str = "first", name_b: str = "second") -> str:
+        if self.equal:
+            return f"OK: {name_a} and {name_b} agree ({self.count_a} rows)"
+        lines = [f"MISMATCH: {name_a} has {self.count_a} rows, {name_b} has {self.count_b}"]
+        for row, ca, cb in self.differences:
+            lines.append(f"  {row}: {ca}x in {name_a}, {cb}x in {name_b}")
+        return "\n".join(lines)
+
+
+def _rows(source: Source) -> Iterable[Tuple[int, ...]]:
+    it = source() if callable(source) else source
+    for row in it:
+        yield tuple(int(v) for v in row)
+
+
+def multiset_digest(source: Source) -> MultisetDigest:
+    digest = MultisetDigest()
+    for row in _rows(source):
+        digest.add(row)
+    return digest
+
+
+def _reiterable(source: Source) -> bool:
+    return callable(source) or iter(source) is not source
+
+
+def _partition(source: Source, buckets: int, dirpath: str, prefix: str) -> List[str]:
+    """Spill the rows of source into `buckets` files by row hash."""
+    paths = [os.path.join(dirpath, f"{prefix}{i}.pkl") for i in range(buckets)]
+    files = [open(path, "wb") for path in paths]
+    pending: List[List[Tuple[int, ...]]] = [[] for _ in range(buckets)]
+    try:
+        for row in _rows(source):
+            i = row_hash(row)[0] % buckets
+            pending[i].append(row)
+            if len(pending[i]) >= SPILL_ROWS:
+                pickle.dump(pending[i], files[i], protocol=pickle.HIGHEST_PROTOCOL)
+                pending[i] = []
+        for f, rows in zip(files, pending):
+            if rows:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def _load_bucket(path: str) -> Counter:
+    counts: Counter = Counter()
+    with open(path, "rb") as f:
+        while True:
+            try:
+                counts.update(pickle.load(f))
+            except EOFError:
+                return counts
+
+
+def _diff_counts(ca: Counter, cb: Counter, out: List, max_diffs: int):
+    for row in sorted(ca.keys() | cb.keys()):
+        if len(out) >= max_diffs:
+            return
+        if ca[row] != cb[row]:
+            out.append((row, ca[row], cb[row]))
+
+
+def bucketed_diff(a: Source, b: Source, max_diffs: int = 10,
+                  buckets: int = 1) -> List[Tuple[Tuple[int, ...], int, int]]:
+    """
+    Up to max_diffs rows whose multiplicity differs between a and b
+    (sorted within a bucket). With buckets > 1 the rows are partitioned
+    into temporary files first, and only one pair of buckets is held in
+    memory at a time.
+    """
+    diffs: List[Tuple[Tuple[int, ...], int, int]] = []
+    if buckets <= 1:
+        _diff_counts(Counter(_rows(a)), Counter(_rows(b)), diffs, max_diffs)
+        return diffs
+
+    with tempfile.TemporaryDirectory(prefix="verify-") as tmp:
+        paths_a = _partition(a, buckets, tmp, "a")
+        paths_b = _partition(b, buckets, tmp, "b")
+        for pa, pb in zip(paths_a, paths_b):
+            _diff_counts(_load_bucket(pa), _load_bucket(pb), diffs, max_diffs)
+            if len(diffs) >= max_diffs:
+                break
+    return diffs
+
+
+def verify_multiset(a: Source, b: Source, max_diffs: int = 10) -> VerificationResult:
+    """
+    Check that a and b contain the same rows with the same multiplicities.
+    The diff on mismatch needs to re-read both sides, so it is only
+    produced for lists or callables, not for one-shot iterators.
+    """
+    da, db = multiset_digest(a), multiset_digest(b)
+    if da == db:
+        return VerificationResult(True, da.count, db.count)
+
+    diffs: List[Tuple[Tuple[int, ...], int, int]] = []
+    if _reiterable(a) and _reiterable(b):
+        buckets = -(-max(da.count, db.count) // DIFF_BUCKET_ROWS)
+        diffs = bucketed_diff(a, b, max_diffs, buckets)
+    return VerificationResult(False, da.count, db.count, diffs)
+
+
+_ROW_RE = re.compile(r"^\s*[\[(]\s*(-?\d+(?:\s*,\s*-?\d+)*)\s*,?\s*[\])]\s*$")
+
+
+def load_printed_results(path: str) -> Iterable[Tuple[int, ...]]:
+    """
+    Parse rows printed as "[1, 2, 3]" (problem2/3) or "(1, 2, 3)" (MySQL)
+    from a captured output file, skipping every other line.
+    """
+    with open(path) as f:
+        for line in f:
+            m = _ROW_RE.match(line)
+            if m:
+                yield tuple(int(v) for v in m.group(1).split(","))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two printed result files as multisets.")
+    parser.add_argument("first")
+    parser.add_argument("second")
+    parser.add_argument("--max-diffs", type=int, default=10)
+    args = parser.parse_args()
+
+    res = verify_multiset(
+        lambda: load_printed_results(args.first),
+        lambda: load_printed_results(args.second),
+        args.max_diffs,
+    )
+    print(res.report(args.first, args.second))
+    raise SystemExit(0 if res.equal else 1)